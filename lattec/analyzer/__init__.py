@@ -1 +1,12 @@
-from .engine import static_analysis, type_analysis  # noqa
+import typing
+from .. import lazy
+
+if typing.TYPE_CHECKING:
+    from .engine import analysis_passes, signature_analysis, static_analysis, type_analysis  # noqa
+
+__getattr__ = lazy.exports(__name__, {
+    "analysis_passes": "engine",
+    "signature_analysis": "engine",
+    "static_analysis": "engine",
+    "type_analysis": "engine",
+})
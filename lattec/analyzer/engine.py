@@ -1,34 +1,60 @@
 from . import scopes, typecheck, returns, constexprs
-from .. import ast, traverse
+from .. import ast, passes
 
 
-def type_analysis(tree: ast.Program) -> ast.Program:
+type_pass = passes.Pass(
+    name="types",
+    stage=1,
+    pre_order=[
+        scopes.infer_scopes_pre,
+        typecheck.infer_types_pre,
+    ],
+    post_order=[
+        typecheck.infer_types_post,
+        scopes.infer_scopes_post,
+    ],
+    setup=scopes.start,
+)
+
+
+constexpr_pass = passes.Pass(
+    name="constexprs",
+    stage=2,
+    post_order=[
+        constexprs.fold_constexprs_post,
+    ],
+    after=["types"],
+)
+
+
+return_pass = passes.Pass(
+    name="returns",
+    stage=2,
+    post_order=[
+        returns.check_returns_post,
+    ],
+    after=["constexprs"],
+)
+
+
+analysis_passes = [type_pass, constexpr_pass, return_pass]
+
+
+def signature_analysis(tree: ast.Program) -> ast.Program:
+    # global part of type_analysis, for programs analyzed one function at a time afterwards
     scopes.clear()
-    ret = traverse.traverse(
-        tree,
-        pre_order=[
-            scopes.infer_scopes_pre,
-            typecheck.infer_types_pre,
-        ],
-        post_order=[
-            typecheck.infer_types_post,
-            scopes.infer_scopes_post,
-        ]
-    )
-    assert isinstance(ret, ast.Program)
+    typecheck.tld_pre(tree)
+    typecheck.tld_post(tree)
+    return tree
+
+
+def type_analysis(tree: ast.Node) -> ast.Node:
+    ret = passes.run(tree, [type_pass])
+    assert isinstance(ret, (ast.Program, ast.FunctionDeclaration))
     return ret
 
 
-def static_analysis(tree: ast.Program) -> ast.Program:
-    scopes.clear()
-    ret = traverse.traverse(
-        tree,
-        pre_order=[
-        ],
-        post_order=[
-            constexprs.fold_constexprs_post,
-            returns.check_returns_post,
-        ]
-    )
-    assert isinstance(ret, ast.Program)
+def static_analysis(tree: ast.Node) -> ast.Node:
+    ret = passes.run(tree, [constexpr_pass, return_pass])
+    assert isinstance(ret, (ast.Program, ast.FunctionDeclaration))
     return ret
@@ -35,7 +35,7 @@ def check_returns_post(node: ast.Node) -> None:
 
     if isinstance(node, ast.FunctionDeclaration):
         assert isinstance(node.type, ast.Function)
-        if not node.body.attrs.returns and node.type.ret != ast.Void():
+        if not node.body.attrs.returns and node.type.ret is not ast.void_t:
             errors.add_error(errors.Error(
                 node.start,
                 node.end,
@@ -1,47 +1,66 @@
-import typing
-from collections import defaultdict
-from .. import ast
+from .. import ast, context
 
+# names are resolved once, here: every local declaration gets a slot, numbered in the order of the
+# walk, and every variable the slot of the declaration it refers to (None for the globals), which
+# is all the later stages look at
 
-var_decls: typing.Dict[str, typing.List[ast.Declaration]] = defaultdict(list)
-scope_stack: typing.List[typing.List[str]] = []
-ignore_stack: typing.List[typing.List[typing.Tuple[str, ast.Declaration]]] = []
+
+def state() -> context.Scopes:
+    return context.current().scopes
 
 
 def infer_scopes_pre(node: ast.Node) -> None:
+    st = state()
     if isinstance(node, ast.Block):
-        scope_stack.append([])
+        st.scope_stack.append({})
 
     if isinstance(node, ast.Expression):
         ignore = node.attrs.ignore_names
         if ignore is not None:
-            ignore_stack.append([])
+            st.ignore_stack.append([])
             for name in ignore:
-                ignore_stack[-1].append((name, var_decls[name].pop()),)
+                st.ignore_stack[-1].append((name, st.var_decls[name].pop()),)
 
     if isinstance(node, ast.FunctionDeclaration):
-        scope_stack.append([])
+        st.scope_stack.append({"return": 1})
         assert isinstance(node.type, ast.Function)
         fn_t = node.type
-        scope_stack[-1].append("return")
-        var_decls["return"].append(ast.decl_from_var_type(ast.Variable(var="return"), fn_t.ret))
+        st.var_decls["return"].append(
+            ast.decl_from_var_type(ast.Variable(var="return"), fn_t.ret))
 
 
 def infer_scopes_post(node: ast.Node) -> None:
+    st = state()
     if isinstance(node, (ast.Block, ast.FunctionDeclaration)):
-        for v in scope_stack.pop():
-            var_decls[v].pop()
+        for v, n in st.scope_stack.pop().items():
+            del st.var_decls[v][-n:]
 
     if isinstance(node, ast.Expression):
         if node.attrs.ignore_names is not None:
-            for nm, vr in ignore_stack.pop():
-                var_decls[nm].append(vr)
+            for nm, vr in st.ignore_stack.pop():
+                st.var_decls[nm].append(vr)
 
     if isinstance(node, ast.Declaration):
-        var_decls[node.var.var].append(node)
-        scope_stack[-1].append(node.var.var)
+        node.attrs.slot = st.slot_cnt
+        st.slot_cnt += 1
+        st.var_decls[node.var.var].append(node)
+        scope = st.scope_stack[-1]
+        scope[node.var.var] = scope.get(node.var.var, 0) + 1
+
+
+def declared_here(name: str) -> bool:
+    return name in state().scope_stack[-1]
+
+
+def start(tree: ast.Node) -> None:
+    # functions analyzed one at a time rely on the globals of signature_analysis
+    st = state()
+    st.slot_cnt = 0
+    if isinstance(tree, ast.Program):
+        clear()
 
 
 def clear() -> None:
-    var_decls.clear()
-    scope_stack.clear()
+    st = state()
+    st.var_decls.clear()
+    st.scope_stack.clear()
@@ -2,23 +2,27 @@ import typing
 import attr
 from .. import ast, prelude, errors
 from ..ast import undef_t
-from .scopes import var_decls
 from . import scopes
-from .. import config
+from .. import context
+
+
+main_t = ast.function_t([], ast.int_t)
 
 
 def expr_post(expr: ast.Expression) -> typing.Optional[ast.Expression]:
+    var_decls = scopes.state().var_decls
     if isinstance(expr, ast.IConstant):
-        expr.attrs.type = ast.Int()
+        expr.attrs.type = ast.int_t
 
     if isinstance(expr, ast.BConstant):
-        expr.attrs.type = ast.Bool()
+        expr.attrs.type = ast.bool_t
 
     if isinstance(expr, ast.SConstant):
-        expr.attrs.type = ast.String()
+        expr.attrs.type = ast.string_t
 
     if isinstance(expr, ast.Variable):
-        if len(var_decls[expr.var]) == 0:
+        decls = var_decls[expr.var]
+        if len(decls) == 0:
             errors.add_error(errors.Error(
                 expr.start,
                 expr.end,
@@ -27,13 +31,14 @@ def expr_post(expr: ast.Expression) -> typing.Optional[ast.Expression]:
             ))
             expr.attrs.type = undef_t
         else:
-            expr.attrs.type = var_decls[expr.var][-1].type
+            expr.attrs.type = decls[-1].type
+            expr.attrs.slot = decls[-1].attrs.slot
 
     if isinstance(expr, ast.Application):
         fn_t = expr.function.attrs.type
 
         # silence poison chain if function is of undefined type
-        if fn_t == undef_t:
+        if fn_t is undef_t:
             expr.attrs.type = undef_t
 
         elif isinstance(fn_t, ast.Function):
@@ -52,7 +57,7 @@ def expr_post(expr: ast.Expression) -> typing.Optional[ast.Expression]:
             # consecutive arguments check, ignore undefineds, they were already reported
             for expected, actual in zip(fn_t.params, expr.args):
                 if (
-                    expected != actual.attrs.type
+                    expected is not actual.attrs.type
                     and not isinstance(actual.attrs.type, ast.UndefinedType)
                 ):
                     errors.add_error(errors.Error(
@@ -65,42 +70,24 @@ def expr_post(expr: ast.Expression) -> typing.Optional[ast.Expression]:
 
         # special workaround for polymorphic operators
         elif isinstance(fn_t, ast.TypeAlternative):
-            expr.attrs.type = ast.undef_t
-            for subtype in fn_t.alt:
+            match = prelude.overloads[expr.function.var].get(
+                tuple(id(e.attrs.type) for e in expr.args))
+            if match is not None:
+                name, subtype = match
                 assert isinstance(subtype, ast.Function)
-                if len(subtype.params) != len(expr.args):
-                    continue
-                if any(
-                    expected != actual.attrs.type
-                    for expected, actual in zip(subtype.params, expr.args)
-                ):
-                    continue
                 expr.attrs.type = subtype.ret
                 expr.function.attrs.type = subtype
-                poly_t = subtype.params[0]
-                if isinstance(poly_t, ast.Int):
-                    t_name = "int"
-                if isinstance(poly_t, ast.String):
-                    t_name = "string"
-                if isinstance(poly_t, ast.Bool):
-                    t_name = "bool"
-                return attr.evolve(
-                    expr,
-                    function=attr.evolve(
-                        expr.function,
-                        var=expr.function.var+"_"+t_name
-                    )
-                )
-            if expr.attrs.type == ast.undef_t:
-                    errors.add_error(errors.Error(
-                        expr.start,
-                        expr.end,
-                        errors.TypeAnalysisKind.FunctionCallMismatch,
-                        f"Could not match overloaded function call with encountered expression. "
-                        f"Possible function types are: {'; '.join(str(e) for e in fn_t.alt)}. "
-                        f"Encountered argument types are: "
-                        f"({', '.join(str(e.attrs.type) for e in expr.args)})",
-                    ))
+                return attr.evolve(expr, function=attr.evolve(expr.function, var=name))
+            expr.attrs.type = ast.undef_t
+            errors.add_error(errors.Error(
+                expr.start,
+                expr.end,
+                errors.TypeAnalysisKind.FunctionCallMismatch,
+                f"Could not match overloaded function call with encountered expression. "
+                f"Possible function types are: {'; '.join(str(e) for e in fn_t.alt)}. "
+                f"Encountered argument types are: "
+                f"({', '.join(str(e.attrs.type) for e in expr.args)})",
+            ))
 
         # if the function isn't well-formed at all
         else:
@@ -115,11 +102,12 @@ def expr_post(expr: ast.Expression) -> typing.Optional[ast.Expression]:
 
 
 def stmt_post(stmt: ast.Statement) -> typing.Optional[ast.Statement]:
+    var_decls = scopes.state().var_decls
 
     if isinstance(stmt, ast.Declaration):
         if len(var_decls[stmt.var.var]) > 0:
             # redeclaration
-            if stmt.var.var in scopes.scope_stack[-1]:
+            if scopes.declared_here(stmt.var.var):
                 errors.add_error(errors.Error(
                     stmt.start,
                     stmt.end,
@@ -128,7 +116,7 @@ def stmt_post(stmt: ast.Statement) -> typing.Optional[ast.Statement]:
                     f"declaration at {var_decls[stmt.var.var][-1].start}.",
                 ))
             # shadow
-            elif config.cfg["wshadow"]:
+            elif context.current().cfg["wshadow"]:
                 errors.add_error(errors.Error(
                     stmt.start,
                     stmt.end,
@@ -140,7 +128,7 @@ def stmt_post(stmt: ast.Statement) -> typing.Optional[ast.Statement]:
     if isinstance(stmt, ast.Assignment):
         tv = stmt.var.attrs.type
         te = stmt.expr.attrs.type
-        if tv != undef_t and te != undef_t and tv != te:
+        if tv is not undef_t and te is not undef_t and tv is not te:
             errors.add_error(errors.Error(
                 stmt.start,
                 stmt.end,
@@ -153,14 +141,14 @@ def stmt_post(stmt: ast.Statement) -> typing.Optional[ast.Statement]:
         te = stmt.val
         ret_t = var_decls["return"][-1].type
         if te is not None:
-            if te.attrs.type != undef_t and isinstance(te.attrs.type, ast.Void):
+            if te.attrs.type is not undef_t and isinstance(te.attrs.type, ast.Void):
                 errors.add_error(errors.Error(
                     stmt.start,
                     stmt.end,
                     errors.TypeAnalysisKind.ReturnTypeMismatch,
                     f"Return of type {te.attrs.type} with value is not permitted",
                 ))
-            if te.attrs.type != undef_t and ret_t != te.attrs.type:
+            if te.attrs.type is not undef_t and ret_t is not te.attrs.type:
                 errors.add_error(errors.Error(
                     stmt.start,
                     stmt.end,
@@ -169,7 +157,7 @@ def stmt_post(stmt: ast.Statement) -> typing.Optional[ast.Statement]:
                     f"expression: {te.attrs.type}.",
                 ))
         else:
-            if ret_t != ast.Void():
+            if ret_t is not ast.void_t:
                 errors.add_error(errors.Error(
                     stmt.start,
                     stmt.end,
@@ -179,17 +167,18 @@ def stmt_post(stmt: ast.Statement) -> typing.Optional[ast.Statement]:
 
     if isinstance(stmt, ast.If) or isinstance(stmt, ast.While):
         cond_t = stmt.cond.attrs.type
-        if cond_t != undef_t and cond_t != ast.Bool():
+        if cond_t is not undef_t and cond_t is not ast.bool_t:
                 errors.add_error(errors.Error(
                     stmt.cond.start,
                     stmt.cond.end,
                     errors.TypeAnalysisKind.ConditionTypeMismatch,
-                    f"This conditional value should be of type {ast.Bool()}, not {cond_t}.",
+                    f"This conditional value should be of type {ast.bool_t}, not {cond_t}.",
                 ))
     return None
 
 
 def tld_pre(tld: ast.Node) -> None:
+    var_decls = scopes.state().var_decls
     if isinstance(tld, ast.FunctionDeclaration):
         d: dict = {}
         for param in tld.params:
@@ -228,6 +217,7 @@ def tld_pre(tld: ast.Node) -> None:
 
 
 def tld_post(tld: ast.Node) -> typing.Optional[ast.Node]:
+    var_decls = scopes.state().var_decls
     if isinstance(tld, ast.Program):
         if "main" not in var_decls:
             errors.add_error(errors.Error(
@@ -236,14 +226,13 @@ def tld_post(tld: ast.Node) -> typing.Optional[ast.Node]:
                 errors.TypeAnalysisKind.NoMain,
                 f"Main function does not exist.",
             ))
-        elif var_decls["main"][-1].type != ast.Function(params=[], ret=ast.Int()):
+        elif var_decls["main"][-1].type is not main_t:
             main = var_decls["main"][-1]
-            main_expected_t = ast.Function(params=[], ret=ast.Int())
             errors.add_error(errors.Error(
                 main.start,
                 main.end,
                 errors.TypeAnalysisKind.NoMain,
-                f"Main function type mismatch. Should be {main_expected_t}, is {main.type}.",
+                f"Main function type mismatch. Should be {main_t}, is {main.type}.",
             ))
     return None
 
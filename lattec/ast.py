@@ -1,3 +1,4 @@
+import bisect
 import typing
 import attr
 from . import colors
@@ -6,7 +7,7 @@ from . import colors
 # GENERAL
 
 
-@attr.s(auto_attribs=True)
+@attr.s(slots=True, auto_attribs=True)
 class AttrObject:
     type:           typing.Any = None
     ignore_names:   typing.Any = None
@@ -14,25 +15,67 @@ class AttrObject:
     returns:        typing.Any = None
     value:          typing.Any = None
     quad_gen:       typing.Any = None
+    slot:           typing.Any = None
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True, repr=False)
+class LineTable:
+    """Start offsets of the lines of a source, resolving offsets to line and column on demand."""
+
+    def __init__(self, source: str) -> None:
+        self.starts = [0]
+        i = source.find("\n")
+        while i != -1:
+            self.starts.append(i+1)
+            i = source.find("\n", i+1)
+
+        self.positions: typing.Dict[int, Position] = {}
+
+    def resolve(self, offset: int) -> typing.Tuple[int, int]:
+        line = bisect.bisect_right(self.starts, offset)
+        return line, offset - self.starts[line-1]
+
+    def position(self, offset: int) -> "Position":
+        # interned, the end of a node is usually the start of the next one
+        ret = self.positions.get(offset)
+        if ret is None:
+            ret = Position(offset=offset, lines=self)
+            self.positions[offset] = ret
+        return ret
+
+
+# positions keep only the raw offset, line and column are computed when a diagnostic needs them
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True, repr=False)
 class Position:
-    line: int
-    column: int
+    offset: int
+    lines: LineTable = attr.ib(eq=False)
+
+    @property
+    def line(self) -> int:
+        return self.lines.resolve(self.offset)[0]
+
+    @property
+    def column(self) -> int:
+        return self.lines.resolve(self.offset)[1]
 
     def __repr__(self):
         return f"{colors.white(str(self.line))}:{colors.white(str(self.column))}"
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Node:
-    start: typing.Optional[Position] = attr.ib(cmp=False, default=None)
-    end: typing.Optional[Position] = attr.ib(cmp=False, default=None)
-    attrs: AttrObject = attr.ib(factory=AttrObject)
+    start: typing.Optional[Position] = attr.ib(eq=False, default=None)
+    end: typing.Optional[Position] = attr.ib(eq=False, default=None)
+    # allocated on first use, most of the type nodes never need one
+    _attrs: typing.Optional[AttrObject] = attr.ib(eq=False, default=None)
+
+    @property
+    def attrs(self) -> AttrObject:
+        if self._attrs is None:
+            object.__setattr__(self, "_attrs", AttrObject())
+        return self._attrs  # type: ignore
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Operator(Node):
     symbol: str
     name: str
@@ -40,12 +83,12 @@ class Operator(Node):
     associativity: str  # "left" or "right"
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Nothing(Node):
     pass
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class NewVariable(Node):
     var: str
 
@@ -53,42 +96,42 @@ class NewVariable(Node):
 # TYPES
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Type(Node):
     pass
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True, repr=False)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True, repr=False)
 class UndefinedType(Type):
     def __repr__(self):
         return colors.white("<Undefined>")
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True, repr=False)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True, repr=False)
 class Int(Type):
     def __repr__(self):
         return colors.white("int")
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True, repr=False)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True, repr=False)
 class Bool(Type):
     def __repr__(self):
         return colors.white("boolean")
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True, repr=False)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True, repr=False)
 class String(Type):
     def __repr__(self):
         return colors.white("string")
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True, repr=False)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True, repr=False)
 class Void(Type):
     def __repr__(self):
         return colors.white("void")
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True, repr=False)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True, repr=False)
 class Function(Type):
     params: typing.List[Type]
     ret: Type
@@ -97,7 +140,7 @@ class Function(Type):
         return colors.white(f"{self.ret}({', '.join(str(e) for e in self.params)})")
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class TypeAlternative(Type):
     alt: typing.List[Type]
 
@@ -105,32 +148,32 @@ class TypeAlternative(Type):
 # EXPRESSIONS
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Expression(Node):
     pass
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Variable(Expression):
     var: str
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class IConstant(Expression):
     val: int
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class BConstant(Expression):
     val: bool
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class SConstant(Expression):
     val: str
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Application(Expression):
     function: Variable
     args: typing.List[Expression]
@@ -139,7 +182,7 @@ class Application(Expression):
 # STATEMENTS
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Statement(Node):
     pass
 
@@ -151,48 +194,48 @@ def _blck_convert(l: typing.List[Statement]) -> typing.List[Statement]:
     )
 
 
-@attr.s(frozen=True, kw_only=True)
+@attr.s(frozen=True, slots=True, kw_only=True)
 class Block(Statement):
     # unroll inlined blocks in converter
     statements = attr.ib(type=typing.List[Statement], converter=_blck_convert)
 
 
 # InlinedBlock does not generate separate scope, it is to be inlined in the parent block
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class InlinedBlock(Statement):
     statements: typing.List[Statement]
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class FreeExpression(Statement):
     expr: Expression
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Declaration(Statement):
     type: Type
     var: NewVariable
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Assignment(Statement):
     var: Variable
     expr: Expression
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Return(Statement):
     val: typing.Optional[Expression]
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class If(Statement):
     cond: Expression
     then_branch: Block
     else_branch: Block
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class While(Statement):
     cond: Expression
     body: Block
@@ -201,7 +244,7 @@ class While(Statement):
 # TOPLEVEL
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class FunctionDeclaration(Node):
     type: Type
     name: str
@@ -209,7 +252,7 @@ class FunctionDeclaration(Node):
     body: Block
 
 
-@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+@attr.s(frozen=True, slots=True, auto_attribs=True, kw_only=True)
 class Program(Node):
     decls: typing.List[FunctionDeclaration]
 
@@ -223,23 +266,72 @@ def decl_from_var_type(v: Variable, t: Type) -> Declaration:
 
 
 def pprint(tree: Node, prefix: str = "") -> None:
-    d = attr.asdict(tree, recurse=False)
-    print(f"{tree.__class__.__name__}")
-    for k, v in d.items():
-        if k not in ["start", "end", "attrs"]:
-            print(f"{prefix}{k}: ", end="")
-            if isinstance(v, list):
-                print()
-                for i, e in enumerate(v):
-                    print(f"{prefix}  {i}: ", end="")
-                    if isinstance(e, Node):
-                        pprint(e, prefix+"    ")
-                    else:
-                        print(f"{v}")
-            elif isinstance(v, Node):
-                pprint(v, prefix+"  ")
-            else:
-                print(f"{v}")
-
-
-undef_t = UndefinedType()
+    # printing work is kept on an explicit stack, so deep trees do not hit the recursion limit
+    stack: typing.List[typing.Tuple[typing.Any, str]] = [(tree, prefix)]
+    while stack:
+        item, arg = stack.pop()
+        if not isinstance(item, Node):
+            print(item, end=arg)
+            continue
+        tree, prefix = item, arg
+        work: typing.List[typing.Tuple[typing.Any, str]] = [(tree.__class__.__name__, "\n")]
+        for k, v in attr.asdict(tree, recurse=False).items():
+            if k not in ["start", "end", "_attrs"]:
+                work.append((f"{prefix}{k}: ", ""))
+                if isinstance(v, list):
+                    work.append(("", "\n"))
+                    for i, e in enumerate(v):
+                        work.append((f"{prefix}  {i}: ", ""))
+                        if isinstance(e, Node):
+                            work.append((e, prefix+"    "))
+                        else:
+                            work.append((f"{v}", "\n"))
+                elif isinstance(v, Node):
+                    work.append((v, prefix+"  "))
+                else:
+                    work.append((f"{v}", "\n"))
+        stack.extend(reversed(work))
+
+
+# each distinct type is a single object without a position, so types can be compared by identity
+_types: typing.Dict[typing.Tuple[typing.Any, ...], Type] = {}
+
+
+def canonical(t: Type) -> Type:
+    # the parts of a type are made canonical first, so their identities are enough for the key
+    if isinstance(t, Function):
+        params = [canonical(e) for e in t.params]
+        ret = canonical(t.ret)
+        key: typing.Tuple[typing.Any, ...] = (Function, id(ret), *map(id, params))
+    elif isinstance(t, TypeAlternative):
+        alt = [canonical(e) for e in t.alt]
+        key = (TypeAlternative, *map(id, alt))
+    else:
+        key = (type(t),)
+
+    ret_t = _types.get(key)
+    if ret_t is None:
+        if isinstance(t, Function):
+            ret_t = Function(params=params, ret=ret)
+        elif isinstance(t, TypeAlternative):
+            ret_t = TypeAlternative(alt=alt)
+        else:
+            ret_t = type(t)()
+        # the first one stored wins when threads race
+        ret_t = _types.setdefault(key, ret_t)
+    return ret_t
+
+
+def function_t(params: typing.List[Type], ret: Type) -> Type:
+    return canonical(Function(params=params, ret=ret))
+
+
+def alternative_t(alt: typing.List[Type]) -> Type:
+    return canonical(TypeAlternative(alt=alt))
+
+
+undef_t = canonical(UndefinedType())
+int_t = canonical(Int())
+bool_t = canonical(Bool())
+string_t = canonical(String())
+void_t = canonical(Void())
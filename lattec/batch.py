@@ -0,0 +1,124 @@
+import concurrent.futures
+import json
+import os
+import subprocess
+import time
+import typing
+from . import cli, compiler, errors
+
+# compiles many files in one process, or in a pool of them, and reports on all of them as JSON:
+# {"files": [entry...], "ok": count, "failed": count, "time": seconds}, where an entry is
+# {"file": path, "ok": bool, "stage": failed stage or null, "errors": [...], "assembler": llvm-as
+# messages or null, "time": {"compile": seconds, "assemble": seconds}}; a crash of the compiler
+# is an error of kind InternalError, with a null stage
+
+
+def sources(paths: typing.List[str]) -> typing.List[str]:
+    """The files given and the .lat files under the directories given, in a stable order."""
+    ret = []
+    for path in paths:
+        if not os.path.isdir(path):
+            ret.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            ret.extend(os.path.join(root, f) for f in sorted(files) if f.endswith(".lat"))
+    return ret
+
+
+def error_entry(e: errors.Error) -> typing.Dict[str, typing.Any]:
+    return {
+        "kind": e.kind.name,
+        "message": e.message,
+        "start": None if e.start is None else [e.start.line, e.start.column],
+        "end": None if e.end is None else [e.end.line, e.end.column],
+    }
+
+
+def input_error(message: str) -> typing.Dict[str, typing.Any]:
+    return {"kind": "InputError", "message": message, "start": None, "end": None}
+
+
+def internal_error(e: Exception) -> typing.Dict[str, typing.Any]:
+    return {
+        "kind": "InternalError", "message": f"{type(e).__name__}: {e}", "start": None, "end": None,
+    }
+
+
+def compile_file(path: str, options: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    entry: typing.Dict[str, typing.Any] = {
+        "file": path, "ok": False, "stage": None, "errors": [], "assembler": None,
+        "time": {"compile": 0.0, "assemble": 0.0},
+    }
+    if not path.endswith(".lat"):
+        entry["errors"].append(input_error("not a .lat file"))
+        return entry
+    basename, llfile, outfile = cli.paths(path, None)
+    try:
+        code = cli.read_source(path)
+    except OSError as e:
+        entry["errors"].append(input_error(str(e)))
+        return entry
+
+    start = time.perf_counter()
+    try:
+        result = compiler.compile(code, options)
+    except Exception as e:
+        # a crash of the compiler on one file, the others are still compiled
+        entry["time"]["compile"] = time.perf_counter() - start
+        entry["errors"].append(internal_error(e))
+        return entry
+    entry["time"]["compile"] = time.perf_counter() - start
+    entry["ok"] = result.ok
+    entry["stage"] = result.stage
+    entry["errors"] = [error_entry(e) for e in result.errors]
+    if not result.ok:
+        if os.path.exists(llfile):
+            os.remove(llfile)
+        return entry
+
+    with open(llfile, "w") as out:
+        out.write(result.llvm)  # type: ignore
+    start = time.perf_counter()
+    asm = subprocess.run(["llvm-as", llfile, "-o", outfile], capture_output=True, text=True)
+    entry["time"]["assemble"] = time.perf_counter() - start
+    if asm.returncode != 0:
+        entry["ok"] = False
+        entry["assembler"] = asm.stderr
+    return entry
+
+
+def compile_all(
+    paths: typing.List[str],
+    options: typing.Dict[str, typing.Any],
+    jobs: int = 1,
+) -> typing.Dict[str, typing.Any]:
+    """Compiles every file of sources(paths), in jobs processes, never stopping at a failure."""
+    files = sources(paths)
+    # with several files at once, every one of them is compiled serially
+    options = {**options, "jobs": 1}
+    start = time.perf_counter()
+    if jobs == 1 or len(files) <= 1:
+        entries = [compile_file(f, options) for f in files]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            entries = list(pool.map(compile_file, files, [options] * len(files)))
+    ok = sum(e["ok"] for e in entries)
+    return {
+        "files": entries,
+        "ok": ok,
+        "failed": len(entries) - ok,
+        "time": time.perf_counter() - start,
+    }
+
+
+def main(paths: typing.List[str], options: typing.Dict[str, typing.Any], report: str) -> int:
+    jobs = options.get("jobs", 1) or os.cpu_count() or 1
+    summary = compile_all(paths, options, jobs)
+    text = json.dumps(summary, indent=2) + "\n"
+    if report == "-":
+        print(text, end="")
+    else:
+        with open(report, "w") as f:
+            f.write(text)
+    return 0 if summary["failed"] == 0 else 1
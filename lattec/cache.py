@@ -0,0 +1,217 @@
+import contextlib
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import shutil
+import typing
+import attr
+from . import ast, errors
+
+# a directory of compilation results keyed by a hash of the source, the compiler and the options
+# which change the output:
+#     objects/KEY.json    the LLVM module or null, the failed stage and the diagnostics
+#     objects/KEY.bc      the assembled module, when the command line produced one
+#     stats               hit and miss counts, the total size of the objects
+#     lock                taken while the objects or the stats change
+# entries are written to a temporary file and renamed into place, so concurrent compilers only
+# ever see whole ones; a hit touches the entry, eviction removes the least recently used first
+
+
+@functools.lru_cache(maxsize=None)
+def fingerprint() -> str:
+    """A hash of the compiler sources, standing for its version."""
+    h = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for dirpath, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(dirpath, name)
+                h.update(os.path.relpath(path, root).encode() + b"\0")
+                with open(path, "rb") as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+
+def output_options(cfg: dict) -> typing.Dict[str, typing.Any]:
+    # the streaming modes number the variables differently than the batch one
+    streaming = bool(cfg["stream"] or cfg["flat"])
+    return {"wshadow": cfg["wshadow"], "stream": streaming, "eval_steps": cfg["eval_steps"]}
+
+
+# errors are stored by the name of their kind, the subclasses of errors.Kind being distinct enums
+_kinds = {cls.__name__: cls for cls in errors.Kind.__subclasses__()}
+
+
+def error_record(e: errors.Error) -> typing.List[typing.Any]:
+    return [
+        type(e.kind).__name__,
+        e.kind.name,
+        None if e.start is None else e.start.offset,
+        None if e.end is None else e.end.offset,
+        e.message,
+    ]
+
+
+def error_of(record: typing.List[typing.Any], lines: ast.LineTable) -> errors.Error:
+    cls, name, start, end, message = record
+    return errors.Error(
+        start=None if start is None else lines.position(start),
+        end=None if end is None else lines.position(end),
+        kind=_kinds[cls][name],
+        message=message,
+    )
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Entry:
+    llvm: typing.Optional[str]
+    errors: typing.List[errors.Error]
+    stage: typing.Optional[int]
+
+
+@attr.s(auto_attribs=True)
+class Cache:
+    root: str
+    max_size: int
+
+    @property
+    def objects(self) -> str:
+        return os.path.join(self.root, "objects")
+
+    def path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.objects, key + suffix)
+
+    def key(self, code: str, cfg: dict) -> str:
+        h = hashlib.sha256()
+        h.update(fingerprint().encode())
+        h.update(json.dumps(output_options(cfg), sort_keys=True).encode())
+        h.update(code.encode())
+        return h.hexdigest()
+
+    @contextlib.contextmanager
+    def locked(self) -> typing.Iterator[typing.Dict[str, int]]:
+        """Holds the lock of the cache, yielding its statistics, which are saved afterwards."""
+        os.makedirs(self.objects, exist_ok=True)
+        with open(os.path.join(self.root, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                stats = self.read_stats()
+                yield stats
+                self.write(os.path.join(self.root, "stats"), json.dumps(stats).encode())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read_stats(self) -> typing.Dict[str, int]:
+        try:
+            with open(os.path.join(self.root, "stats")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # missing or damaged, counted anew
+            size = sum(e.stat().st_size for e in os.scandir(self.objects) if e.is_file())
+            return {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "size": size}
+
+    def write(self, path: str, data: bytes) -> None:
+        # not mkstemp, whose files only the owner can read: the cache may be shared, so the
+        # entries get the permissions of any file created under the umask
+        tmp = os.path.join(os.path.dirname(path), ".tmp" + os.urandom(8).hex())
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def get(self, key: str, code: str) -> typing.Optional[Entry]:
+        path = self.path(key, ".json")
+        try:
+            with open(path) as f:
+                record = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            record = None
+        with self.locked() as stats:
+            stats["hits" if record is not None else "misses"] += 1
+        if record is None:
+            return None
+        lines = ast.LineTable(code)
+        return Entry(
+            llvm=record["llvm"],
+            errors=[error_of(e, lines) for e in record["errors"]],
+            stage=record["stage"],
+        )
+
+    def put(self, key: str, entry: Entry) -> None:
+        data = json.dumps({
+            "llvm": entry.llvm,
+            "errors": [error_record(e) for e in entry.errors],
+            "stage": entry.stage,
+        }).encode()
+        self.store(self.path(key, ".json"), data)
+
+    def get_bitcode(self, key: str, dest: str) -> bool:
+        try:
+            shutil.copyfile(self.path(key, ".bc"), dest)
+            return True
+        except OSError:
+            return False
+
+    def put_bitcode(self, key: str, src: str) -> None:
+        with open(src, "rb") as f:
+            data = f.read()
+        # the entry may have been evicted meanwhile, the bitcode is not kept without it
+        if os.path.exists(self.path(key, ".json")):
+            self.store(self.path(key, ".bc"), data)
+
+    def store(self, path: str, data: bytes) -> None:
+        with self.locked() as stats:
+            try:
+                stats["size"] -= os.stat(path).st_size
+            except OSError:
+                pass
+            self.write(path, data)
+            stats["size"] += len(data)
+            stats["stores"] += 1
+            if stats["size"] > self.max_size:
+                self.evict(stats)
+
+    def evict(self, stats: typing.Dict[str, int]) -> None:
+        # entries by the time of their last use, the bitcode going with its entry (first, if the
+        # entry is gone)
+        sizes: typing.Dict[str, int] = {}
+        used: typing.Dict[str, float] = {}
+        for e in os.scandir(self.objects):
+            if not e.is_file() or e.name.startswith(".tmp"):
+                continue
+            key, suffix = os.path.splitext(e.name)
+            st = e.stat()
+            sizes[key] = sizes.get(key, 0) + st.st_size
+            if suffix == ".json":
+                used[key] = st.st_mtime
+        stats["size"] = sum(sizes.values())
+        for key in sorted(sizes, key=lambda k: used.get(k, 0.0)):
+            if stats["size"] <= self.max_size:
+                break
+            for suffix in (".json", ".bc"):
+                with contextlib.suppress(OSError):
+                    os.remove(self.path(key, suffix))
+            stats["size"] -= sizes[key]
+            stats["evictions"] += 1
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self.locked() as stats:
+            ret = dict(stats)
+        ret["entries"] = sum(1 for e in os.scandir(self.objects) if e.name.endswith(".json"))
+        return ret
+
+
+def of(cfg: dict) -> typing.Optional[Cache]:
+    """The cache the options ask for, if any. Reports on the work of the compiler itself are only
+    made by actually compiling, so they go past the cache."""
+    if not cfg["cache"] or cfg["packrat"] or cfg["report_walks"] or cfg["stats"] or cfg["profile"]:
+        return None
+    return Cache(cfg["cache"], cfg["cache_size"])
@@ -0,0 +1,161 @@
+import argparse
+import os
+import typing
+
+# only the standard library is imported here, the thin client must start fast
+
+if typing.TYPE_CHECKING:
+    from . import cache
+
+
+# where tempfile.gettempdir() would mostly look, tempfile itself taking longer to import than all
+# of the command line parsing
+default_socket = os.path.join(os.environ.get("TMPDIR") or "/tmp", f"latc-{os.getuid()}.sock")
+
+
+def argparser(**kwargs: typing.Any) -> argparse.ArgumentParser:
+    argp = argparse.ArgumentParser(**kwargs)
+    argp.add_argument("input", nargs="?", help="compiler input file")
+    argp.add_argument("-o", metavar="output_file", help="compiler output file", default=None)
+    argp.add_argument(
+        "--silent", dest="silent", help="silences errors", action='store_true', default=False)
+    argp.add_argument(
+        "--mrjp", dest="mrjp", help="turns on special mrjp testing mode", action='store_true',
+        default=False
+    )
+    argp.add_argument(
+        "--packrat", dest="packrat",
+        help="memoizes backtracking parser rules, reports the hit rate",
+        action='store_true', default=False
+    )
+    argp.add_argument(
+        "--stream", dest="stream", help="compiles and writes out one function at a time",
+        action='store_true', default=False
+    )
+    argp.add_argument(
+        "--flat", dest="flat",
+        help="keeps the parsed program in flat arrays, building one function at a time (implies "
+        "--stream)", action='store_true', default=False
+    )
+    argp.add_argument(
+        "-j", "--jobs", dest="jobs", metavar="n", type=int, nargs="?", const=0, default=1,
+        help="lowers the functions in n processes, all the cores if n is omitted or 0, giving the "
+        "output of the default mode; --stream and --flat compile in one process"
+    )
+    argp.add_argument(
+        "--eval-steps", dest="eval_steps", metavar="n", type=int, default=10000,
+        help="the most steps evaluating a call of a pure function at compile time may take, 0 "
+        "turns the evaluation off; only the whole program is evaluated, not with --stream "
+        "(default: 10000)"
+    )
+    argp.add_argument(
+        "--walks", dest="walks", help="reports the tree walks performed by the compiler passes",
+        action='store_true', default=False
+    )
+    argp.add_argument(
+        "--time-passes", dest="stats", action="store_const", const="table",
+        help="reports time, memory and counters of every stage as a table (same as --stats=table)"
+    )
+    argp.add_argument(
+        "--stats", dest="stats", choices=["table", "json"], default=None,
+        help="reports time, memory and counters of every stage, as a table after the result or "
+        "as a Chrome trace written to --stats-file; memory is traced, slowing the compilation"
+    )
+    argp.add_argument(
+        "--stats-file", dest="stats_file", metavar="file", default=None,
+        help="where --stats=json writes the trace (default: the input with .trace.json)"
+    )
+    argp.add_argument(
+        "--profile", dest="profile", metavar="dir", default=None,
+        help="profiles every stage, writing STAGE.pstats and flame graph stacks (STAGE.collapsed, "
+        "all.collapsed) to dir"
+    )
+    argp.add_argument(
+        "--profile-mode", dest="profile_mode", choices=["cprofile", "sample"], default="cprofile",
+        help="cprofile records every call, sample records the stack every --profile-interval, "
+        "slowing long compilations far less but writing no pstats"
+    )
+    argp.add_argument(
+        "--profile-interval", dest="profile_interval", metavar="ms", type=float, default=1.0,
+        help="time between the samples of --profile-mode=sample (default: 1)"
+    )
+    argp.add_argument(
+        "--cache", dest="cache", metavar="dir", default=os.environ.get("LATC_CACHE"),
+        help="keeps the results of compilations in dir and reuses them (default: $LATC_CACHE)"
+    )
+    argp.add_argument(
+        "--cache-size", dest="cache_size", metavar="MiB", type=int, default=256,
+        help="size the cache is kept under, the least recently used results are removed first"
+    )
+    argp.add_argument(
+        "--socket", dest="socket", metavar="path", default=default_socket,
+        help=f"unix socket of the compile server (default: {default_socket})"
+    )
+    return argp
+
+
+def options(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    return {
+        "silent": args.silent,
+        "mrjp_testing": args.mrjp,
+        "input": args.input,
+        "output": args.o,
+        "packrat": args.packrat,
+        "stream": args.stream,
+        "flat": args.flat,
+        "report_walks": args.walks,
+        "jobs": args.jobs,
+        "eval_steps": args.eval_steps,
+        "cache": args.cache,
+        "cache_size": args.cache_size * 2**20,
+        "stats": args.stats,
+        "stats_file": args.stats_file,
+        "profile": args.profile,
+        "profile_mode": args.profile_mode,
+        "profile_interval": args.profile_interval / 1000,
+    }
+
+
+def paths(input: str, output: typing.Optional[str]) -> typing.Tuple[str, str, str]:
+    # base name, the textual module and the bitcode file
+    assert input[-4:] == ".lat"
+    basename = os.path.expanduser(input)[:-4]
+    return basename, f"{basename}.ll", output or f"{basename}.bc"
+
+
+def trace_path(basename: str, stats_file: typing.Optional[str]) -> str:
+    return stats_file or f"{basename}.trace.json"
+
+
+def read_source(input: str) -> str:
+    return open(os.path.expanduser(input), "r").read().replace("\t", "    ")
+
+
+def assemble(basename: str, llfile: str, outfile: str, mrjp_testing: bool) -> None:
+    os.system(f"llvm-as {llfile} -o {outfile}")
+    mrjp_test(basename, outfile, mrjp_testing)
+
+
+def assemble_cached(
+    basename: str,
+    llfile: str,
+    outfile: str,
+    mrjp_testing: bool,
+    store: typing.Optional["cache.Cache"],
+    key: str,
+) -> None:
+    # the bitcode of a result is kept in the cache along with it
+    if store is None:
+        assemble(basename, llfile, outfile, mrjp_testing)
+    elif store.get_bitcode(key, outfile):
+        mrjp_test(basename, outfile, mrjp_testing)
+    else:
+        assemble(basename, llfile, outfile, mrjp_testing)
+        store.put_bitcode(key, outfile)
+
+
+def mrjp_test(basename: str, outfile: str, mrjp_testing: bool) -> None:
+    if mrjp_testing:
+        os.system(f"lli {outfile} >tmp.out")
+        os.system(f"diff -q tmp.out {basename}.output")
+        os.system(f"rm tmp.out")
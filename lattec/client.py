@@ -0,0 +1,65 @@
+import json
+import os
+import socket
+import sys
+import typing
+from . import cli
+
+# the compiler itself is only imported when no server is running
+
+
+def request(path: str, req: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        with sock.makefile("rwb") as f:
+            f.write(json.dumps(req).encode() + b"\n")
+            f.flush()
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"the compile server at {path} closed the connection")
+    return json.loads(line)
+
+
+def main(argv: typing.List[str]) -> int:
+    argp = cli.argparser(description="compiles through a running latc_llvm --serve")
+    args = argp.parse_args(argv)
+    if args.input is None:
+        argp.error("the following arguments are required: input")
+    options = cli.options(args)
+    # the server runs in a directory of its own
+    for name in ["cache", "profile"]:
+        if options[name] is not None:
+            options[name] = os.path.abspath(options[name])
+    basename, llfile, outfile = cli.paths(args.input, args.o)
+    code = cli.read_source(args.input)
+
+    try:
+        response = request(args.socket, {"code": code, "options": options})
+    except (FileNotFoundError, ConnectionRefusedError):
+        from . import compiler, config
+        config.cfg.update(options)
+        compiler.main()
+        return 0
+    if "error" in response:
+        sys.stderr.write(response["error"])
+        return 1
+
+    if response["exit"] == 0:
+        with open(llfile, "w") as out:
+            out.write(response["llvm"])
+    elif os.path.exists(llfile):
+        os.remove(llfile)
+    print(response["report"], end="")
+    if response.get("trace") is not None:
+        with open(cli.trace_path(basename, args.stats_file), "w") as f:
+            json.dump(response["trace"], f)
+    if response["exit"] != 0:
+        return response["exit"]
+    store, key = None, ""
+    if response.get("cache") is not None:
+        # the cache the server used, the one of the request or else its own
+        from . import cache
+        store = cache.Cache(response["cache"]["dir"], response["cache"]["size"])
+        key = response["cache"]["key"]
+    cli.assemble_cached(basename, llfile, outfile, args.mrjp, store, key)
+    return 0
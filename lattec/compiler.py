@@ -1,39 +1,275 @@
+import collections
+import io
 import os
-from . import parser, analyzer, quadruplets, errors, config, llvm_backend, colors
-
-
-def compile() -> None:
-    filename = config.cfg["input"]
-    outname = config.cfg["output"]
-    assert filename[-4:] == ".lat"
-    filename = os.path.expanduser(filename)
-    basename = filename[:-4]
-    llfile = f"{basename}.ll"
-    outfile = outname or f"{basename}.bc"
-
-    code = open(filename, "r").read().replace("\t", "    ")
-    steps = [
-        parser.program_parser,
-        analyzer.type_analysis,
-        analyzer.static_analysis,
-        quadruplets.quadruplet_generation,
-        quadruplets.assignment_elimination_mem,
-        quadruplets.pruning,
-        llvm_backend.generate_llvm,
-    ]
-    prog = code
-    for no, step in enumerate(steps):
-        prog = step(prog)  # type: ignore
-        if errors.errors():
-            print(colors.red("ERROR"))
-            if not config.cfg["silent"]:
-                errors.print_errors(code)
-            exit(-1-no)
-
-    print(colors.green("OK"))
-    open(llfile, "w").write(prog)
-    os.system(f"llvm-as {llfile} -o {outfile}")
-    if config.cfg["mrjp_testing"]:
-        os.system(f"lli {outfile} >tmp.out")
-        os.system(f"diff -q tmp.out {basename}.output")
-        os.system(f"rm tmp.out")
+import typing
+import attr
+from . import parser, analyzer, quadruplets, errors, config, llvm_backend, colors, passes
+from . import ast, cli, context, telemetry
+
+if typing.TYPE_CHECKING:
+    from . import cache, quads as Q
+
+# the stages are imported on first use (see lazy), as are flat, parallel and cache below, so that
+# starting up takes no more than this module
+
+
+class CompilationFailed(Exception):
+    def __init__(self, stage: int) -> None:
+        super().__init__(stage)
+        self.stage = stage
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Result:
+    # the LLVM module, None if it failed or was written out during the compilation
+    llvm: typing.Optional[str]
+    errors: typing.List[errors.Error]
+    # the stage which failed, None on success
+    stage: typing.Optional[int]
+    context: context.CompilationContext
+    # taken from the cache, without compiling
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.stage is None
+
+
+def check_errors(stage: int) -> None:
+    if errors.errors():
+        raise CompilationFailed(stage)
+
+
+def quad_count(prog: "typing.Union[Q.Program, Q.Function]") -> int:
+    return sum(len(f.body) for f in prog) if isinstance(prog, list) else len(prog.body)
+
+
+def analysed(tree: ast.Node) -> ast.Node:
+    # analysis and the walk of quadruplet generation, sharing the tree walks wherever the passes
+    # allow; the walk gives the declarations their variables
+    with context.current().telemetry.stage("analysis"):
+        return passes.run(
+            tree,
+            analyzer.analysis_passes + [quadruplets.quadruplet_pass],
+            check_errors,
+        )
+
+
+def generated(tree: ast.Node) -> "typing.Union[Q.Program, Q.Function]":
+    stats = context.current().telemetry
+    with stats.stage("quadruplets"):
+        ret = quadruplets.lowered(tree)
+        stats.count("quads out", quad_count(ret))
+    return ret
+
+
+def lower(tree: ast.Node) -> "typing.Union[Q.Program, Q.Function]":
+    return generated(analysed(tree))
+
+
+def run_steps(
+    prog: "typing.Union[Q.Program, Q.Function]",
+    steps: typing.List[typing.Tuple[str, typing.Callable]],
+    first: int = 4,
+) -> typing.Any:
+    # the steps after lower, their stages following its
+    stats = context.current().telemetry
+    for no, (name, step) in enumerate(steps, first):
+        with stats.stage(name):
+            stats.count("quads in", quad_count(prog))
+            prog = step(prog)
+            if name != "llvm":
+                stats.count("quads out", quad_count(prog))
+        check_errors(no)
+    return prog
+
+
+def lower_function(fn: ast.Node) -> "Q.Function":
+    # all the steps of a function in the streaming modes
+    check_errors(0)
+    return run_steps(lower(fn), [
+        ("memassignment", quadruplets.eliminate_fn),
+        ("sccp", quadruplets.propagate),
+        ("pruning", quadruplets.prune),
+        ("ssa", quadruplets.promote),
+    ])
+
+
+def compile_streaming(code: str, out: typing.TextIO) -> None:
+    # signatures of all the functions are collected first, then each function goes through all
+    # the steps and is written out before the next one gets parsed
+    stats = context.current().telemetry
+    functions = parser.function_stream(code)
+    if context.current().cfg["flat"]:
+        from . import flat
+        # the whole program is parsed up front into flat arrays, node objects are only built for
+        # the function being compiled
+        with stats.stage("parse"):
+            tree = flat.from_stream(functions)
+        functions = flat.function_stream(tree) if tree is not None else iter([ast.Nothing()])
+
+    def parsed() -> typing.Iterator[ast.Node]:
+        while True:
+            with stats.stage("parse"):
+                fn = next(functions, None)
+            if fn is None:
+                return
+            yield fn
+
+    stream = parsed()
+    signatures = next(stream)
+    check_errors(0)
+    with stats.stage("signatures"):
+        analyzer.signature_analysis(signatures)  # type: ignore
+        check_errors(1)
+        quadruplets.signature_generation(signatures)  # type: ignore
+
+    llvm_backend.write_llvm((lower_function(fn) for fn in stream), out)
+
+
+def compile_batch(code: str) -> str:
+    with context.current().telemetry.stage("parse"):
+        prog = parser.program_parser(code)
+    check_errors(0)
+    prog = run_steps(lower(prog), [("memassignment", quadruplets.assignment_elimination_mem)])
+    return optimized(prog)
+
+
+def optimized(prog: "Q.Program") -> str:
+    # the steps of the whole program after memassignment, its pure functions being evaluated in
+    # sccp, up to the LLVM module
+    return run_steps(prog, [
+        ("sccp", quadruplets.propagation),
+        ("pruning", quadruplets.pruning),
+        ("ssa", quadruplets.promotion),
+        ("llvm", llvm_backend.generate_llvm),
+    ], first=5)
+
+
+def run(code: str, out: typing.Optional[typing.TextIO]) -> Result:
+    ctx = context.current()
+    if ctx.cfg["profile"]:
+        from . import profiling
+        ctx.telemetry.profiler = profiling.of(ctx.cfg)
+    try:
+        return run_mode(code, out)
+    finally:
+        if ctx.telemetry.profiler is not None:
+            ctx.telemetry.profiler.write(ctx.cfg["profile"])
+
+
+def run_mode(code: str, out: typing.Optional[typing.TextIO]) -> Result:
+    ctx = context.current()
+    try:
+        if ctx.cfg["stream"] or ctx.cfg["flat"]:
+            buf = io.StringIO() if out is None else out
+            compile_streaming(code, buf)
+            llvm = buf.getvalue() if out is None else None  # type: ignore
+        else:
+            if ctx.cfg["jobs"] != 1:
+                from . import parallel
+                llvm = parallel.compile_parallel(code, ctx.cfg["jobs"] or os.cpu_count() or 1)
+                if llvm is None:
+                    return run_serially(code, out)
+            else:
+                llvm = compile_batch(code)
+            if out is not None:
+                out.write(llvm)
+                llvm = None
+    except CompilationFailed as e:
+        return Result(llvm=None, errors=ctx.errors, stage=e.stage, context=ctx)
+    return Result(llvm=llvm, errors=ctx.errors, stage=None, context=ctx)
+
+
+def run_serially(code: str, out: typing.Optional[typing.TextIO]) -> Result:
+    # a program the processes found errors in is compiled again in a context of its own and in one
+    # process, so that its diagnostics are those of compile_batch, of the whole program at once
+    ctx = context.current()
+    serial = context.CompilationContext(cfg={**ctx.cfg, "jobs": 1}, telemetry=ctx.telemetry)
+    with context.activate(serial):
+        return run_mode(code, out)
+
+
+def _cache(cfg: dict) -> typing.Optional["cache.Cache"]:
+    if not cfg["cache"]:
+        return None
+    from . import cache
+    return cache.of(cfg)
+
+
+def compile(
+    code: str,
+    options: typing.Dict[str, typing.Any] = {},
+    out: typing.Optional[typing.TextIO] = None,
+) -> Result:
+    """Compiles a Latte program to LLVM IR in a context of its own, options override config.cfg.
+    If out is given, the IR is written there, as it is generated in the streaming modes, and
+    llvm of the result is None. On failure, out may hold a part of the module. With more than one
+    job, the functions are lowered in a pool of processes, giving the output of the default mode.
+    With a cache, a program compiled before with the same options is not compiled again. With a
+    profile directory, the profiles of the stages are written there."""
+    ctx = context.CompilationContext(cfg={**config.cfg, **options})
+    ctx.telemetry.enabled = bool(ctx.cfg["stats"])
+    with context.activate(ctx), telemetry.running(ctx.telemetry.enabled):
+        store = _cache(ctx.cfg)
+        if store is None:
+            return run(code, out)
+        from . import cache
+
+        key = store.key(code, ctx.cfg)
+        entry = store.get(key, code)
+        if entry is None:
+            result = run(code, None)
+            store.put(key, cache.Entry(llvm=result.llvm, errors=result.errors, stage=result.stage))
+        else:
+            ctx.errors.extend(entry.errors)
+            result = Result(
+                llvm=entry.llvm, errors=ctx.errors, stage=entry.stage, context=ctx, cached=True)
+        if out is not None and result.llvm is not None:
+            out.write(result.llvm)
+            result.llvm = None
+        return result
+
+
+def report(code: str, result: Result) -> str:
+    """What the command line prints about a compilation."""
+    cfg = result.context.cfg
+    if not result.ok:
+        return colors.red("ERROR") + "\n" + (
+            "" if cfg["silent"] else errors.format_errors(code, result.errors))
+
+    ret = [colors.green("OK")]
+    if cfg["packrat"] and not cfg["silent"]:
+        st = result.context.memo_stats
+        lookups = st["hits"] + st["misses"]
+        ret.append(
+            f"packrat: {st['hits']} hits, {st['misses']} misses, {st['evictions']} evictions "
+            f"({st['hits'] / max(lookups, 1):.1%} hit rate)"
+        )
+    if cfg["report_walks"] and not cfg["silent"]:
+        walk_log = result.context.walk_log
+        ret.append(f"tree walks: {len(walk_log)}")
+        walks = collections.Counter(" + ".join(names) for names in walk_log)
+        for names, cnt in walks.items():
+            ret.append(f"    {cnt} x {names}")
+    if cfg["stats"] == "table" and not cfg["silent"]:
+        ret.extend(telemetry.table(result.context.telemetry.spans))
+    return "".join(e + "\n" for e in ret)
+
+
+def main() -> None:
+    basename, llfile, outfile = cli.paths(config.cfg["input"], config.cfg["output"])
+    code = cli.read_source(config.cfg["input"])
+    with open(llfile, "w") as out:
+        result = compile(code, out=out)
+    print(report(code, result), end="")
+    if config.cfg["stats"] == "json":
+        with open(cli.trace_path(basename, config.cfg["stats_file"]), "w") as f:
+            import json
+            json.dump(telemetry.trace(result.context.telemetry), f)
+    if not result.ok:
+        os.remove(llfile)
+        exit(-1-result.stage)  # type: ignore
+    store = _cache(config.cfg)
+    key = "" if store is None else store.key(code, config.cfg)
+    cli.assemble_cached(basename, llfile, outfile, config.cfg["mrjp_testing"], store, key)
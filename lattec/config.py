@@ -4,4 +4,18 @@ cfg: dict = {
     "silent": False,
     "wshadow": False,
     "mrjp_testing": False,
+    "packrat": False,
+    "packrat_size": 4096,
+    "stream": False,
+    "flat": False,
+    "report_walks": False,
+    "jobs": 1,
+    "eval_steps": 10000,
+    "cache": None,
+    "cache_size": 256 * 2**20,
+    "stats": None,
+    "stats_file": None,
+    "profile": None,
+    "profile_mode": "cprofile",
+    "profile_interval": 0.001,
 }
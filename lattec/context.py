@@ -0,0 +1,68 @@
+import contextlib
+import contextvars
+import typing
+from collections import defaultdict
+import attr
+from . import config
+from .telemetry import Telemetry
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Scopes:
+    # declarations visible under each name, the innermost one last
+    var_decls: typing.DefaultDict[str, typing.List[typing.Any]] = attr.ib(
+        factory=lambda: defaultdict(list))
+    # the names declared in each open scope, with the number of their declarations there
+    scope_stack: typing.List[typing.Dict[str, int]] = attr.ib(factory=list)
+    ignore_stack: typing.List[typing.List[typing.Tuple[str, typing.Any]]] = attr.ib(factory=list)
+    # slots given to the local declarations of the tree so far
+    slot_cnt: int = 0
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class CompilationContext:
+    """Everything a compilation keeps between its steps. The stages find it with current, so
+    compilations running in different threads, or one inside another, do not interfere."""
+    cfg: dict = attr.ib(factory=lambda: dict(config.cfg))
+    errors: typing.List[typing.Any] = attr.ib(factory=list)
+
+    # parser
+    memo_table: typing.Dict[typing.Tuple[int, int], typing.Any] = attr.ib(factory=dict)
+    memo_stats: typing.Dict[str, int] = attr.ib(
+        factory=lambda: {"hits": 0, "misses": 0, "evictions": 0})
+
+    # passes
+    walk_log: typing.List[typing.List[str]] = attr.ib(factory=list)
+    telemetry: Telemetry = attr.ib(factory=Telemetry)
+
+    # analyzer.scopes
+    scopes: Scopes = attr.ib(factory=Scopes)
+
+    # quads, the variable of every slot and the global ones by name
+    slot_vars: typing.List[typing.Any] = attr.ib(factory=list)
+    global_vars: typing.Dict[str, typing.Any] = attr.ib(factory=dict)
+    var_cnt: int = 0
+    label_cnt: int = 0
+    string_cnt: int = 0
+    quad_list: typing.List[typing.Any] = attr.ib(factory=list)
+    defer_stack: typing.List[typing.List[typing.Any]] = attr.ib(factory=list)
+    string_const_list: typing.List[str] = attr.ib(factory=list)
+
+
+# used outside of activate, its options are config.cfg itself
+_default = CompilationContext(cfg=config.cfg)
+_current: contextvars.ContextVar = contextvars.ContextVar("lattec_context", default=None)
+
+
+def current() -> CompilationContext:
+    ret = _current.get()
+    return _default if ret is None else ret
+
+
+@contextlib.contextmanager
+def activate(ctx: CompilationContext) -> typing.Iterator[CompilationContext]:
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
@@ -1,7 +1,7 @@
 import typing
 import enum
 import attr
-from . import ast, colors
+from . import ast, colors, context
 
 
 class Kind(enum.Enum):
@@ -42,27 +42,24 @@ class Error:
     message: str
 
 
-_l: typing.List[Error] = []
-
-
 def clear_errors() -> None:
-    _l.clear()
+    context.current().errors.clear()
 
 
 def errors() -> typing.List[Error]:
-    return _l
+    return context.current().errors
 
 
 def add_error(e: Error) -> None:
-    _l.append(e)
+    context.current().errors.append(e)
 
 
-def print_errors(code: str) -> None:
+def format_errors(code: str, errs: typing.List[Error]) -> str:
     lines = code.split("\n")
-    for e in errors():
-        print(
-            f"at {e.start} to {e.end}\n{colors.red(e.kind.name)}:")
-        print(f"    {e.message}")
+    out: typing.List[str] = []
+    for e in errs:
+        out.append(f"at {e.start} to {e.end}\n{colors.red(e.kind.name)}:")
+        out.append(f"    {e.message}")
         if e.start is None or e.end is None:
             continue
 
@@ -70,16 +67,21 @@ def print_errors(code: str) -> None:
         en = min(e.end.line+2, len(lines))
         for i in range(st, en):
             line = lines[i]
-            print(f"{colors.white(str(i+1).rjust(4))}:   {colors.cyan(line)}")
+            out.append(f"{colors.white(str(i+1).rjust(4))}:   {colors.cyan(line)}")
             if i+1 == e.start.line and i+1 == e.end.line:
-                print(" "*8+colors.red("".join(
+                out.append(" "*8+colors.red("".join(
                     "^" if e.start.column <= j and e.end.column >= j else " "
                     for j in range(len(line))
                 )))
             elif i+1 == e.start.line:
-                print(" "*8+colors.red(" "*e.start.column + "^"*(len(line) - e.start.column)))
+                out.append(" "*8+colors.red(" "*e.start.column + "^"*(len(line) - e.start.column)))
             elif i+1 == e.end.line:
-                print(" "*8+colors.red("^"*e.end.column + " "*(len(line) - e.end.column)))
+                out.append(" "*8+colors.red("^"*e.end.column + " "*(len(line) - e.end.column)))
             elif i+1 > e.start.line and i+1 < e.end.line:
-                print(" "*8+colors.red("^"*len(line)))
-        print()
+                out.append(" "*8+colors.red("^"*len(line)))
+        out.append("")
+    return "".join(e + "\n" for e in out)
+
+
+def print_errors(code: str, errs: typing.Optional[typing.List[Error]] = None) -> None:
+    print(format_errors(code, errors() if errs is None else errs), end="")
@@ -0,0 +1,234 @@
+import array
+import typing
+import attr
+from . import ast, traverse
+
+
+# every node class gets a one byte kind code, in the order of definition
+node_kinds: typing.List[type] = [
+    c for c in vars(ast).values() if isinstance(c, type) and issubclass(c, ast.Node)
+]
+kind_codes: typing.Dict[type, int] = {c: i for i, c in enumerate(node_kinds)}
+
+NODE = 0
+LIST = 1
+VALUE = 2
+
+_layouts: typing.Dict[type, typing.Tuple[typing.Tuple[str, int], ...]] = {}
+
+
+def layout(cls: type) -> typing.Tuple[typing.Tuple[str, int], ...]:
+    """Fields of a node class in the order they are stored in the operands, with their encoding:
+    a node index (-1 for None), a count followed by node indices, or a pool index."""
+    ret = _layouts.get(cls)
+    if ret is None:
+        children = traverse.child_fields(cls)
+        ret = tuple(
+            (f.name, VALUE if f.name not in children
+                else LIST if getattr(f.type, "__origin__", None) is list else NODE)
+            for f in attr.fields(cls) if f.name not in ["start", "end", "_attrs"]
+        )
+        _layouts[cls] = ret
+    return ret
+
+
+class FlatTree:
+    """A tree kept in flat arrays instead of node objects. Nodes are numbered in post-order, so
+    the children of a node always come before it; subtrees shared between parents are stored
+    once, as is each canonical type over the whole tree. Node objects are only rebuilt on demand,
+    see node; the passes after parsing run on those, not on the arrays."""
+
+    def __init__(self, lines: ast.LineTable) -> None:
+        self.lines = lines
+        self.kinds = array.array("B")
+        # source offsets, -1 for no position
+        self.starts = array.array("i")
+        self.ends = array.array("i")
+        # the operands of node i start at first[i]
+        self.first = array.array("i")
+        self.operands = array.array("i")
+        # identifiers and literals, each distinct one stored once
+        self.pool: typing.List[typing.Any] = []
+        self.pool_index: typing.Dict[typing.Tuple[type, typing.Any], int] = {}
+        # the only attribute set by the parser which later passes read, on the few nodes having it
+        self.ignore_names: typing.Dict[int, typing.List[str]] = {}
+        # the indices of the canonical types by their ids, which stay valid as the canonical types
+        # are never freed, unlike the ids of the other nodes once their subtree is added
+        self.types: typing.Dict[int, int] = {}
+        self.root = -1
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def nbytes(self) -> int:
+        return sum(
+            a.itemsize * len(a)
+            for a in [self.kinds, self.starts, self.ends, self.first, self.operands]
+        )
+
+    def intern(self, value: typing.Any) -> int:
+        # keyed by type as well, True and 1 are different literals
+        key = (type(value), value)
+        ret = self.pool_index.get(key)
+        if ret is None:
+            ret = len(self.pool)
+            self.pool.append(value)
+            self.pool_index[key] = ret
+        return ret
+
+    def add(self, root: ast.Node, known: typing.Dict[int, int] = {}) -> int:
+        """Appends the subtree and returns the index of its root. Nodes found in known, by id, are
+        not stored again, their index from there is used, as are canonical types added before."""
+        seen = dict(known)
+        stack: typing.List[typing.Tuple[ast.Node, bool]] = [(root, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in seen:
+                continue
+            if id(node) in self.types and isinstance(node, ast.Type):
+                seen[id(node)] = self.types[id(node)]
+                continue
+            if not ready:
+                stack.append((node, True))
+                for k in reversed(traverse.child_fields(type(node))):
+                    v = getattr(node, k)
+                    for e in reversed(v) if isinstance(v, list) else [v]:
+                        if e is not None:
+                            stack.append((e, False))
+                continue
+            seen[id(node)] = self._append(node, seen)
+            if isinstance(node, ast.Type) and ast.canonical(node) is node:
+                self.types[id(node)] = seen[id(node)]
+        return seen[id(root)]
+
+    def _append(self, node: ast.Node, seen: typing.Dict[int, int]) -> int:
+        ret = len(self.kinds)
+        self.kinds.append(kind_codes[type(node)])
+        self.starts.append(-1 if node.start is None else node.start.offset)
+        self.ends.append(-1 if node.end is None else node.end.offset)
+        self.first.append(len(self.operands))
+        for name, how in layout(type(node)):
+            v = getattr(node, name)
+            if how == NODE:
+                self.operands.append(-1 if v is None else seen[id(v)])
+            elif how == LIST:
+                self.operands.append(len(v))
+                self.operands.extend(seen[id(e)] for e in v)
+            else:
+                self.operands.append(self.intern(v))
+        if node._attrs is not None and node._attrs.ignore_names is not None:
+            self.ignore_names[ret] = node._attrs.ignore_names
+        return ret
+
+    def kind(self, i: int) -> type:
+        return node_kinds[self.kinds[i]]
+
+    def fields(self, i: int) -> typing.Dict[str, typing.Any]:
+        """Fields of node i without building it: child indices, lists of them, or values."""
+        ret: typing.Dict[str, typing.Any] = {}
+        at = self.first[i]
+        for name, how in layout(self.kind(i)):
+            v = self.operands[at]
+            at += 1
+            if how == NODE:
+                ret[name] = None if v == -1 else v
+            elif how == LIST:
+                ret[name] = self.operands[at:at+v].tolist()
+                at += v
+            else:
+                ret[name] = self.pool[v]
+        return ret
+
+    def children(self, i: int) -> typing.List[int]:
+        ret = []
+        kw = self.fields(i)
+        for name, how in layout(self.kind(i)):
+            v = kw[name]
+            if how == LIST:
+                ret.extend(v)
+            elif how == NODE and v is not None:
+                ret.append(v)
+        return ret
+
+    def position(self, offset: int) -> typing.Optional[ast.Position]:
+        return None if offset == -1 else self.lines.position(offset)
+
+    def node(self, i: int) -> ast.Node:
+        """Builds the node objects of the subtree rooted at i."""
+        needed = set()
+        stack = [i]
+        while stack:
+            j = stack.pop()
+            if j not in needed:
+                needed.add(j)
+                stack.extend(self.children(j))
+
+        built: typing.Dict[int, ast.Node] = {}
+        for j in sorted(needed):
+            kw = self.fields(j)
+            for name, how in layout(self.kind(j)):
+                if how == NODE and kw[name] is not None:
+                    kw[name] = built[kw[name]]
+                elif how == LIST:
+                    kw[name] = [built[e] for e in kw[name]]
+            node = self.kind(j)(
+                start=self.position(self.starts[j]), end=self.position(self.ends[j]), **kw)
+            if isinstance(node, ast.Type):
+                node = ast.canonical(node)
+            if j in self.ignore_names:
+                node.attrs.ignore_names = self.ignore_names[j]
+            built[j] = node
+        return built[i]
+
+
+def flatten(tree: ast.Node) -> FlatTree:
+    assert tree.start is not None
+    ret = FlatTree(tree.start.lines)
+    ret.root = ret.add(tree)
+    return ret
+
+
+def from_stream(functions: typing.Iterator[ast.Node]) -> typing.Optional[FlatTree]:
+    """Flattens the output of parser.function_stream, holding the objects of one function at a
+    time. Returns None on a parse error. Only the parsed program is kept flat: the functions are
+    rebuilt one by one for the passes after parsing, see function_stream."""
+    signatures = next(functions)
+    if not isinstance(signatures, ast.Program):
+        return None
+    assert signatures.start is not None
+    ret = FlatTree(signatures.start.lines)
+    decls = []
+    for fn in functions:
+        if not isinstance(fn, ast.FunctionDeclaration):
+            return None
+        decls.append(ret.add(fn))
+        # the arrays hold plain offsets, position objects are only interned for built nodes
+        ret.lines.positions.clear()
+    # the program node refers to the full functions in place of the signatures it was parsed with
+    ret.root = ret.add(signatures, dict(zip((id(e) for e in signatures.decls), decls)))
+    return ret
+
+
+def function_stream(tree: FlatTree) -> typing.Iterator[ast.Node]:
+    """Same as parser.function_stream, with the functions rebuilt from a flat tree."""
+    decls = tree.fields(tree.root)["decls"]
+
+    def signature(i: int) -> ast.FunctionDeclaration:
+        kw = tree.fields(i)
+        return ast.FunctionDeclaration(
+            start=tree.position(tree.starts[i]),
+            end=tree.position(tree.ends[i]),
+            type=tree.node(kw["type"]),  # type: ignore
+            name=kw["name"],
+            params=[tree.node(e) for e in kw["params"]],  # type: ignore
+            body=ast.Block(statements=[]),
+        )
+
+    yield ast.Program(
+        start=tree.position(tree.starts[tree.root]),
+        end=tree.position(tree.ends[tree.root]),
+        decls=[signature(i) for i in decls],
+    )
+    for i in decls:
+        tree.lines.positions.clear()
+        yield tree.node(i)
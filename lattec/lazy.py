@@ -0,0 +1,19 @@
+import importlib
+import sys
+import typing
+
+
+def exports(package: str, names: typing.Dict[str, str]) -> typing.Callable[[str], typing.Any]:
+    """A module __getattr__ for a package re-exporting names of its submodules, which imports the
+    submodule defining a name when it is first looked up instead of with the package."""
+    def getattr_(name: str) -> typing.Any:
+        if name not in names:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        module = importlib.import_module(f"{package}.{names[name]}")
+        # all the names of the submodule at once, the import binds the submodule itself in the
+        # package, which may hide one of them (quadruplets.pruning)
+        for n, m in names.items():
+            if m == names[name]:
+                setattr(sys.modules[package], n, getattr(module, n))
+        return getattr(module, name)
+    return getattr_
@@ -1 +1,11 @@
-from .backend import generate_llvm  # noqa
+import typing
+from .. import lazy
+
+if typing.TYPE_CHECKING:
+    from .backend import generate_llvm, generate_function, write_llvm  # noqa
+
+__getattr__ = lazy.exports(__name__, {
+    "generate_llvm": "backend",
+    "generate_function": "backend",
+    "write_llvm": "backend",
+})
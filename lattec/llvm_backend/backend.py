@@ -1,5 +1,6 @@
 import typing
 import collections
+from .. import context
 from .. import quads as Q
 from . import resources
 
@@ -96,13 +97,33 @@ def generate_function(f: Q.Function) -> typing.List[str]:
         if isinstance(q, Q.Store):
             ret.append(f"    store {q.source.type} {q.source}, {q.target.type} {q.target}")
 
+        if isinstance(q, Q.Phi):
+            incoming = ", ".join(f"[ {v}, {l} ]" for v, l in q.incoming)
+            ret.append(f"    {q.target} = phi {q.target.type} {incoming}")
+
     ret.append("}")
     ret.append("")
     return ret
 
 
+def write_llvm(funcs: typing.Iterable[Q.Function], out: typing.TextIO) -> None:
+    # same output as generate_llvm, but every function is written out as soon as it arrives
+    stats = context.current().telemetry
+    out.write(resources.LLVM_RUNTIME)
+    for no, f in enumerate(funcs):
+        with stats.stage("llvm"):
+            stats.count("quads in", len(f.body))
+            strings = context.current().string_cnt
+            if no != 0:
+                out.write("\n")
+            out.write("\n".join(generate_function(f)))
+            stats.count("string constants", context.current().string_cnt - strings)
+    out.write("\n"+"\n".join(Q.get_string_consts()))
+
+
 def generate_llvm(funcs: Q.Program) -> str:
     code = resources.LLVM_RUNTIME
     code += "\n".join(l for f in funcs for l in generate_function(f))
+    context.current().telemetry.count("string constants", context.current().string_cnt)
     code += "\n"+"\n".join(Q.get_string_consts())
     return code
@@ -0,0 +1,182 @@
+import concurrent.futures
+import multiprocessing
+import multiprocessing.context
+import typing
+import attr
+from . import parser, analyzer, quadruplets, errors, compiler, context
+from . import telemetry
+from . import quads as Q
+
+# the functions are parsed, analysed, lowered and go through memassignment in worker processes,
+# the steps after it in the calling one, over the whole program as compile_batch does: sccp
+# evaluates the pure functions of the program, with a budget of steps shared by all of its calls.
+# compile_batch gives the variables their numbers in phases, those of the declarations of all the
+# functions first (in the walk of quadruplet generation), then those the generation makes, then
+# memassignment. Each worker numbers the variables and labels of its function from zero, which
+# puts the phases one after another; the counts of each phase give the numbers of the whole
+# program. A program with errors in it is compiled again in one process, whose diagnostics are
+# those of the whole program, see compiler.run_serially
+
+
+@attr.s(frozen=True, auto_attribs=True)
+class Lowered:
+    # None if the function has errors
+    function: typing.Optional[Q.Function]
+    # variables of the declarations, of the generation and of memassignment
+    var_cnts: typing.Tuple[int, int, int]
+    label_cnt: int
+    # recorded by the worker, when the stages are measured
+    spans: typing.List[telemetry.Span] = attr.ib(factory=list)
+    # the profiles since the previous function, see profiling.Profiler.export
+    profile: typing.Optional[typing.Any] = None
+
+
+# how the pools start their processes, by forking the calling one unless start_from_forkserver was
+# called
+_mp_context: typing.Optional[multiprocessing.context.BaseContext] = None
+
+
+def start_from_forkserver() -> None:
+    """Makes the pools start their processes from a fork server, a process of its own with one
+    thread, for callers whose other threads may hold locks the forked processes would inherit, as
+    those of the compile server do."""
+    global _mp_context
+    _mp_context = multiprocessing.get_context("forkserver")
+    _mp_context.set_forkserver_preload([__name__])
+
+
+# state of a worker process, set up by init_worker
+_worker: typing.Dict[str, typing.Any] = {}
+
+
+def init_worker(code: str, cfg: dict) -> None:
+    ctx = context.CompilationContext(cfg=cfg)
+    ctx.telemetry.enabled = bool(cfg["stats"])
+    # the one compilation of the process, until it exits
+    telemetry.start_compilation(ctx.telemetry.enabled)
+    if cfg["profile"]:
+        from . import profiling
+        ctx.telemetry.profiler = profiling.of(cfg)
+    with context.activate(ctx):
+        tokens = parser.tokenize(code)
+        signatures, starts = parser.parse_signatures(tokens)
+        # the parent reports failures in the signatures, they never get here
+        analyzer.signature_analysis(signatures)  # type: ignore
+        quadruplets.signature_generation(signatures)  # type: ignore
+    _worker.update(ctx=ctx, tokens=tokens, starts=starts)
+
+
+def lower_function(no: int) -> Lowered:
+    ctx = _worker["ctx"]
+    res = lowered(no)
+    if ctx.telemetry.profiler is not None:
+        res = attr.evolve(res, profile=ctx.telemetry.profiler.export())
+    return res
+
+
+def lowered(no: int) -> Lowered:
+    ctx = _worker["ctx"]
+    with context.activate(ctx):
+        errors.clear_errors()
+        ctx.var_cnt = 0
+        ctx.label_cnt = 0
+        ctx.telemetry.spans = []
+        with ctx.telemetry.stage("parse"):
+            fn = parser.parse_function(_worker["tokens"], _worker["starts"][no])
+        try:
+            compiler.check_errors(0)
+            tree = compiler.analysed(fn)
+            declared = ctx.var_cnt
+            f = compiler.generated(tree)
+            generated = ctx.var_cnt - declared
+            f = compiler.run_steps(f, [("memassignment", quadruplets.eliminate_fn)])
+        except compiler.CompilationFailed:
+            return Lowered(None, (0, 0, 0), 0, spans=ctx.telemetry.spans)
+        var_cnts = (declared, generated, ctx.var_cnt - declared - generated)
+        return Lowered(f, var_cnts, ctx.label_cnt, spans=ctx.telemetry.spans)
+
+
+def renumbered(
+    f: Q.Function, var: typing.Callable[[int], int], label_offset: int
+) -> Q.Function:
+    def val(v: typing.Any) -> typing.Any:
+        if isinstance(v, Q.Var):
+            return attr.evolve(v, name=f"v{var(int(v.name[1:]))}")
+        if isinstance(v, Q.Label) and v.name != "entry":
+            return Q.Label(f"L{int(v.name[1:]) + label_offset}")
+        if isinstance(v, list):
+            return [val(e) for e in v]
+        if isinstance(v, tuple):
+            return tuple(val(e) for e in v)
+        return v
+
+    def quad(q: Q.Quad) -> Q.Quad:
+        if isinstance(q, Q.Label):
+            return val(q)
+        return attr.evolve(q, **{a.name: val(getattr(q, a.name)) for a in attr.fields(type(q))})
+
+    return attr.evolve(f, params=val(f.params), body=[quad(q) for q in f.body])
+
+
+def numbers(
+    var_cnts: typing.Tuple[int, int, int], firsts: typing.List[int]
+) -> typing.Callable[[int], int]:
+    # the number in the whole program of a variable of a function, given the first number of
+    # each phase in the function
+    declared, generated, _ = var_cnts
+
+    def var(n: int) -> int:
+        if n < declared:
+            return firsts[0] + n
+        if n < declared + generated:
+            return firsts[1] + n - declared
+        return firsts[2] + n - declared - generated
+    return var
+
+
+def renumbered_program(results: typing.List[Lowered]) -> Q.Program:
+    totals = [sum(res.var_cnts[phase] for res in results) for phase in range(3)]
+    firsts = [0, totals[0], totals[0] + totals[1]]
+    labels = 0
+    ret = []
+    for res in results:
+        ret.append(renumbered(res.function, numbers(res.var_cnts, firsts), labels))  # type: ignore
+        firsts = [first + cnt for first, cnt in zip(firsts, res.var_cnts)]
+        labels += res.label_cnt
+    return ret
+
+
+def compile_parallel(code: str, jobs: int) -> typing.Optional[str]:
+    """Same as compiler.compile_batch, with the functions lowered by jobs processes. None if the
+    program has errors, which are left for the compilation of the whole program to report."""
+    ctx = context.current()
+    with ctx.telemetry.stage("parse"):
+        tokens = parser.tokenize(code)
+        signatures, starts = parser.parse_signatures(tokens)
+    if errors.errors():
+        return None
+    with ctx.telemetry.stage("signatures"):
+        analyzer.signature_analysis(signatures)  # type: ignore
+        if errors.errors():
+            return None
+        quadruplets.signature_generation(signatures)  # type: ignore
+
+    results: typing.List[Lowered] = []
+    jobs = min(jobs, max(len(starts), 1))
+    with concurrent.futures.ProcessPoolExecutor(
+        jobs, mp_context=_mp_context, initializer=init_worker, initargs=(code, ctx.cfg)
+    ) as pool:
+        chunksize = max(len(starts) // (jobs * 8), 1)
+        for res in pool.map(lower_function, range(len(starts)), chunksize=chunksize):
+            ctx.telemetry.spans.extend(res.spans)
+            if res.profile is not None and ctx.telemetry.profiler is not None:
+                ctx.telemetry.profiler.merge(res.profile)
+            if res.function is None:
+                pool.shutdown(cancel_futures=True)
+                return None
+            results.append(res)
+
+    prog = renumbered_program(results)
+    ctx.var_cnt = sum(sum(res.var_cnts) for res in results)
+    ctx.label_cnt = sum(res.label_cnt for res in results)
+    return compiler.optimized(prog)
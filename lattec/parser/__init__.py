@@ -1 +1,15 @@
-from .toplevel import program_parser # noqa
+import typing
+from .. import lazy
+
+if typing.TYPE_CHECKING:
+    from .toplevel import program_parser, function_stream, parse_signatures, parse_function # noqa
+    from .lexer import tokenize # noqa
+
+# the grammar is built when the parser is first used, not on import
+__getattr__ = lazy.exports(__name__, {
+    "program_parser": "toplevel",
+    "function_stream": "toplevel",
+    "parse_signatures": "toplevel",
+    "parse_function": "toplevel",
+    "tokenize": "lexer",
+})
@@ -1,9 +1,10 @@
 import parsy as P
 from . import general as G
+from . import lexer as L
 from .. import ast, errors, prelude
 
 
-variable = G.addpos(G.identifier.map(lambda v: ast.Variable(var=v)))
+variable = G.memo(G.addpos(G.identifier.map(lambda v: ast.Variable(var=v))))
 
 
 int_literal = G.addpos(G.number.map(lambda v: ast.IConstant(val=v)))
@@ -16,26 +17,25 @@ bool_literal = G.addpos(
 )
 
 
-string_literal = G.addpos(G.lexeme(
-    P.regex(r'".*?"').map(lambda s: ast.SConstant(val=s[1:-1])).desc("string literal")))
+string_literal = G.addpos(
+    G.token(L.STRING, "string literal").map(lambda s: ast.SConstant(val=s[1:-1])))
 
 
-unary_operator = G.addpos(P.alt(*map(
-    lambda k: G.symbol(k).result(prelude.unary_operator_map[k]),
-    prelude.unary_operator_map.keys()
-)).desc("unary operator"))
+loosest_precedence = max(op.precedence for op in prelude.binary_operator_map.values())
 
 
-binary_operator = G.addpos(P.alt(*map(
-    lambda k: G.symbol(k).result(prelude.binary_operator_map[k]),
-    prelude.binary_operator_map.keys()
-)).desc("binary operator"))
+# operators are dispatched on by looking the next token up in the prelude operator maps
+def operator_at(table, stream, index):
+    if index < len(stream) and stream[index].kind == L.SYMBOL:
+        return table.get(stream[index].text)
+    return None
 
 
 def var_from_op(op: ast.Operator) -> ast.Variable:
     return ast.Variable(start=op.start, end=op.end, var=op.name)
 
 
+@G.memo
 @P.generate
 def parens_expression():
     start = yield G.pos
@@ -61,56 +61,76 @@ def parens_expression():
             return params[0]
 
 
-@P.generate
-def single_expression():
-    unary = yield unary_operator.optional()
-
-    # ordering below: variable after parens_expression to parse function calls correctly!
-    elt = yield P.alt(
-        int_literal,
-        bool_literal,
-        string_literal,
-        parens_expression,
-        variable
-    )
-    if unary is not None:
-        unary = var_from_op(unary)
-        return ast.Application(start=unary.start, end=elt.end, function=unary, args=[elt])
-    else:
-        return elt
+# ordering below: variable after parens_expression to parse function calls correctly!
+primary_expression = P.alt(
+    int_literal,
+    bool_literal,
+    string_literal,
+    parens_expression,
+    variable
+)
 
 
-@P.generate
-def expression():
-    fst = yield single_expression
-    rest = yield P.seq(binary_operator, single_expression).map(tuple).many()
-
-    val_stack = [fst]
-    op_stack = []
-
-    def apply_op():
-        h2 = val_stack.pop()
-        h1 = val_stack.pop()
-        o = op_stack.pop()
-        o = var_from_op(o)
-        val_stack.append(ast.Application(
-            start=h1.start,
-            end=h2.end,
-            function=o,
-            args=[h1, h2]
-        ))
-
-    for op, val in rest:
-        while len(op_stack) != 0 and (
-            op_stack[-1].precedence < op.precedence or
-            (op_stack[-1].precedence == op.precedence and op_stack[-1].associativity == "left")
-        ):
-            apply_op()
-        op_stack.append(op)
-        val_stack.append(val)
-
-    while len(op_stack) != 0:
-        apply_op()
-    assert len(val_stack) == 1 and len(op_stack) == 0
-
-    return val_stack[-1]
+def operator_var(op: ast.Operator, stream, index) -> ast.Variable:
+    return ast.Variable(
+        start=G.position(stream, index), end=G.position(stream, index+1), var=op.name)
+
+
+@G.memo
+@P.Parser
+def single_expression(stream, index):
+    op = operator_at(prelude.unary_operator_map, stream, index)
+    if op is None:
+        return primary_expression(stream, index).aggregate(
+            P.Result.failure(index, "unary operator"))
+
+    res = primary_expression(stream, index+1)
+    if not res.status:
+        return res
+    elt = res.value
+    unary = operator_var(op, stream, index)
+    return P.Result.success(
+        res.index,
+        ast.Application(start=unary.start, end=elt.end, function=unary, args=[elt]),
+    ).aggregate(res)
+
+
+def climb(stream, index, loosest):
+    """Precedence climbing: parses operands joined by operators binding at most as loose as
+    loosest (lower precedence value binds tighter)."""
+    res = single_expression(stream, index)
+    if not res.status:
+        return res
+    lhs = res.value
+    index = res.index
+
+    while True:
+        op = operator_at(prelude.binary_operator_map, stream, index)
+        if op is None or op.precedence > loosest:
+            return P.Result.success(index, lhs).aggregate(res).aggregate(
+                P.Result.failure(index, "binary operator"))
+
+        rhs_res = climb(
+            stream,
+            index+1,
+            op.precedence - 1 if op.associativity == "left" else op.precedence,
+        )
+        res = res.aggregate(rhs_res)
+        if not rhs_res.status:
+            return P.Result.success(index, lhs).aggregate(res)
+
+        rhs = rhs_res.value
+        lhs = ast.Application(
+            start=lhs.start,
+            end=rhs.end,
+            function=operator_var(op, stream, index),
+            args=[lhs, rhs],
+        )
+        index = rhs_res.index
+
+
+@G.nested
+@G.memo
+@P.Parser
+def expression(stream, index):
+    return climb(stream, index, loosest_precedence)
@@ -1,23 +1,19 @@
+import contextvars
+import threading
+import typing
 import parsy as P
 import attr
-from .. import ast
+from . import lexer as L
+from .. import ast, context
 
 
-reserved = [
-    "if",
-    "else",
-    "while",
-    "return",
-    "int",
-    "string",
-    "boolean",
-    "void",
-    "true",
-    "false",
-]
+def position(stream: L.TokenStream, index: int) -> ast.Position:
+    return stream.lines.position(stream.offset(index))
 
 
-pos = P.line_info.combine(lambda l, c: ast.Position(line=l+1, column=c))
+@P.Parser
+def pos(stream: L.TokenStream, index: int) -> P.Result:
+    return P.Result.success(index, position(stream, index))
 
 
 def addpos(p):
@@ -31,44 +27,135 @@ def addpos(p):
     return addpos_impl
 
 
-sc = P.alt(
-    P.regex(r"\s+", P.re.MULTILINE),
-    P.regex(r"/\*.*?\*/", P.re.MULTILINE | P.re.DOTALL),
-    P.regex(r"//.*\n"),
-    P.regex(r"#.*\n"),
-).desc("whitespace").many()
-
-
-def lexeme(p):
-    return p << sc
+# packrat cache of the compilation context, keyed by (rule, token index); oldest entries are
+# evicted first when full
+def memo(p):
+    @P.Parser
+    def memo_impl(stream, index):
+        ctx = context.current()
+        if not ctx.cfg["packrat"]:
+            return p(stream, index)
+        key = (id(p), index)
+        ret = ctx.memo_table.get(key)
+        if ret is not None:
+            ctx.memo_stats["hits"] += 1
+            return ret
+        ctx.memo_stats["misses"] += 1
+        ret = p(stream, index)
+        if len(ctx.memo_table) >= ctx.cfg["packrat_size"]:
+            del ctx.memo_table[next(iter(ctx.memo_table))]
+            ctx.memo_stats["evictions"] += 1
+        ctx.memo_table[key] = ret
+        return ret
+    return memo_impl
+
+
+def clear_memo() -> None:
+    context.current().memo_table.clear()
+
+
+def reset_memo_stats() -> None:
+    stats = context.current().memo_stats
+    for k in stats:
+        stats[k] = 0
+
+
+# the grammar nests Python calls as deep as the parsed code nests, and the recursion limit is never
+# raised, as it would be for every thread of the process. Instead the rules the grammar recurses
+# through are nested, and past nesting_limit levels on one thread, the parse of the rule goes on on
+# a new thread, whose recursion starts anew. A parse starting too deep in the calling thread for
+# even that is run again on a new thread
+nesting_limit = 8
+_nesting = threading.local()
+
+
+def _on_new_thread(f, *args):
+    ret: typing.List[typing.Any] = []
+    # the thread has to see the compilation context of the caller, and the measuring and profiling
+    # of the stage go over to it
+    ctx = contextvars.copy_context()
+    telemetry = context.current().telemetry
+    profiler = telemetry.profiler
+
+    def run():
+        try:
+            if profiler is None:
+                ret.append((True, ctx.run(telemetry.run_here, f, *args)))
+            else:
+                ret.append((True, ctx.run(telemetry.run_here, profiler.run_here, f, *args)))
+        except BaseException as e:
+            ret.append((False, e))
+
+    thread = threading.Thread(target=run)
+    if profiler is not None:
+        profiler.pause()
+    try:
+        thread.start()
+        thread.join()
+    finally:
+        if profiler is not None:
+            profiler.resume()
+    ok, value = ret[0]
+    if not ok:
+        raise value
+    return value
+
+
+def nested(p):
+    @P.Parser
+    def nested_impl(stream, index):
+        level = getattr(_nesting, "level", 0)
+        if level >= nesting_limit:
+            return _on_new_thread(p, stream, index)
+        _nesting.level = level + 1
+        try:
+            return p(stream, index)
+        finally:
+            _nesting.level = level
+    return nested_impl
+
+
+def deep(f, *args):
+    try:
+        return f(*args)
+    except RecursionError:
+        return _on_new_thread(f, *args)
+
+
+def token(kind: str, description: str):
+    return P.test_item(lambda t: t.kind == kind, description).map(lambda t: t.text)
 
 
 def symbol(str):
-    return lexeme(P.string(str))
+    if str in L.symbols:
+        return P.test_item(lambda t: t.kind == L.SYMBOL and t.text == str, str)
+
+    # compound symbols are not tokens of their own, they have to be spelled out without spaces
+    @P.Parser
+    def compound_symbol_impl(stream, index):
+        end = index + len(str)
+        if (
+            end <= len(stream)
+            and all(
+                t.kind == L.SYMBOL and t.text == c
+                for t, c in zip(stream[index:end], str)
+            )
+            and stream[end-1].offset - stream[index].offset == len(str) - 1
+        ):
+            return P.Result.success(end, str)
+        return P.Result.failure(index, str)
+    return compound_symbol_impl
 
 
 def rword(str):
-    @lexeme
-    @P.generate
-    def rword_impl():
-        yield P.string(str)
-        yield identifier.should_fail("too long identifier")
-    return rword_impl
+    return P.test_item(lambda t: t.kind == L.KEYWORD and t.text == str, str)
 
 
 def parens(p):
     return symbol("(") >> p << symbol(")")
 
 
-number = lexeme(P.regex(r'(0|[1-9][0-9]*)')).map(int).desc("integer")
-
-
-@P.generate
-def identifier_impl():
-    lex = yield lexeme(P.regex(r"[_a-zA-Z][_'a-zA-Z0-9]*"))
-    if lex in reserved:
-        return P.fail("<not a reserved identifier>")
-    return lex
+number = token(L.INTEGER, "integer").map(int)
 
 
-identifier = identifier_impl.desc("identifier")
+identifier = token(L.IDENTIFIER, "identifier")
@@ -0,0 +1,82 @@
+import re
+import sys
+import typing
+import attr
+from .. import ast, prelude
+
+
+IDENTIFIER = "identifier"
+KEYWORD = "keyword"
+INTEGER = "integer"
+STRING = "string"
+SYMBOL = "symbol"
+UNKNOWN = "unknown"
+
+
+reserved = [
+    "if",
+    "else",
+    "while",
+    "return",
+    "int",
+    "string",
+    "boolean",
+    "void",
+    "true",
+    "false",
+]
+
+
+# "++" and "--" are deliberately not single tokens: they are matched by the statement grammar as
+# two adjacent "+"/"-" symbols, so that "a--b" still lexes as "a - -b"
+symbols = sorted(
+    set(prelude.binary_operator_map) | set(prelude.unary_operator_map) | {
+        "(", ")", "{", "}", ",", ";", "=",
+    },
+    key=len,
+    reverse=True,
+)
+
+
+_token_re = re.compile("|".join([
+    r"(?P<whitespace>\s+|(?s:/\*.*?\*/)|//.*\n|#.*\n)",
+    r"(?P<word>[_a-zA-Z][_'a-zA-Z0-9]*)",
+    r"(?P<integer>0|[1-9][0-9]*)",
+    r'(?P<string>".*?")',
+    r"(?P<symbol>" + "|".join(map(re.escape, symbols)) + ")",
+    r"(?P<unknown>.)",
+]))
+
+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class Token:
+    kind: str
+    offset: int
+    text: str
+
+
+class TokenStream(typing.List[Token]):
+    """Tokens of a single source, remembering the source for position bookkeeping."""
+
+    def __init__(self, source: str, tokens: typing.Iterable[Token]) -> None:
+        super().__init__(tokens)
+        self.source = source
+        self.lines = ast.LineTable(source)
+
+    def offset(self, index: int) -> int:
+        return self[index].offset if index < len(self) else len(self.source)
+
+
+def tokenize(source: str) -> TokenStream:
+    intern = sys.intern
+    reserved_set = set(reserved)
+    tokens: typing.List[Token] = []
+    for m in _token_re.finditer(source):
+        kind = m.lastgroup
+        if kind == "whitespace":
+            continue
+        text = intern(m.group())
+        if kind == "word":
+            kind = KEYWORD if text in reserved_set else IDENTIFIER
+        tokens.append(Token(intern(kind), m.start(), text))  # type: ignore
+    return TokenStream(source, tokens)
@@ -129,7 +129,7 @@ def while_stmt():
     return ast.While(cond=cond, body=body)
 
 
-raw_statement = P.alt(
+raw_statement = G.nested(P.alt(
     brace_block,
     declaration,
     assignment,
@@ -139,7 +139,7 @@ raw_statement = P.alt(
     if_stmt,
     while_stmt,
     free_expr
-)
+))
 
 
 @G.addpos
@@ -1,5 +1,7 @@
+import typing
 import parsy as P
 from . import general as G
+from . import lexer as L
 from . import expressions as E
 from . import statements as S
 from . import types as T
@@ -7,38 +9,119 @@ from .. import ast
 from .. import errors
 
 
-@G.addpos
-@P.generate
-def function():
-    hd_beg = yield G.pos
-    ret = yield T.type
-    name = yield G.identifier
-    params = yield G.parens(P.seq(T.type, E.variable).sep_by(G.symbol(",")))
-    hd_end = yield G.pos
-    body = yield S.statement
-    types = [e[0] for e in params]
-    vars = [ast.decl_from_var_type(v, t) for t, v in params]
-    type = ast.Function(start=hd_beg, end=hd_end, params=types, ret=ret)
-    return ast.FunctionDeclaration(type=type, name=name, params=vars, body=body)
+def function_of(body_parser):
+    @G.addpos
+    @P.generate
+    def function_impl():
+        ret = yield T.type
+        name = yield G.identifier
+        params = yield G.parens(P.seq(T.type, E.variable).sep_by(G.symbol(",")))
+        body = yield body_parser
+        types = [e[0] for e in params]
+        vars = [ast.decl_from_var_type(v, t) for t, v in params]
+        type = ast.function_t(types, ret)
+        return ast.FunctionDeclaration(type=type, name=name, params=vars, body=body)
+    return function_impl
+
+
+# skips a braced body by matching braces on tokens, without building any of the tree
+@P.Parser
+def skipped_body(stream, index):
+    if index >= len(stream) or stream[index].kind != L.SYMBOL or stream[index].text != "{":
+        return S.statement(stream, index)
+    depth = 0
+    for i in range(index, len(stream)):
+        t = stream[i]
+        if t.kind == L.SYMBOL and t.text == "{":
+            depth += 1
+        elif t.kind == L.SYMBOL and t.text == "}":
+            depth -= 1
+            if depth == 0:
+                return P.Result.success(i+1, ast.Block(statements=[]))
+    return P.Result.failure(len(stream), "}")
+
+
+function = function_of(S.statement)
+
+
+signature = function_of(skipped_body)
 
 
 @G.addpos
 @P.generate
 def program():
-    decls = yield G.sc >> function.many()
+    decls = yield function.many()
     return ast.Program(decls=decls)
 
 
+def add_parse_error(tokens: L.TokenStream, expected: typing.FrozenSet[str], index: int) -> None:
+    where = G.position(tokens, index)
+    errors.add_error(errors.Error(
+        start=where,
+        end=where,
+        kind=errors.ParseKind.ParserError,
+        # report the source offset rather than the token index
+        message=str(P.ParseError(expected, tokens.source, tokens.offset(index)))
+    ))
+
+
 def program_parser(prog: str) -> ast.Node:
+    tokens = L.tokenize(prog)
+    G.reset_memo_stats()
     try:
-        result = program.parse(prog)
+        result = G.deep(program.parse, tokens)
         return result
     except P.ParseError as e:
-        l, c = P.line_info_at(e.stream, e.index)
-        errors.add_error(errors.Error(
-            start=ast.Position(line=l+1, column=c),
-            end=ast.Position(line=l+1, column=c),
-            kind=errors.ParseKind.ParserError,
-            message=str(e)
-        ))
+        add_parse_error(tokens, e.expected, e.index)
         return ast.Nothing()
+    finally:
+        G.clear_memo()
+
+
+def parse_signatures(tokens: L.TokenStream) -> typing.Tuple[ast.Node, typing.List[int]]:
+    """A Program made of the signatures of all the functions (with empty bodies) and the token
+    index each of them starts at, or ast.Nothing on a parse error."""
+    G.reset_memo_stats()
+    starts = []
+    signatures = []
+    index = 0
+    while index < len(tokens):
+        res = G.deep(signature, tokens, index)
+        G.clear_memo()
+        if not res.status:
+            add_parse_error(tokens, res.expected, res.furthest)
+            return ast.Nothing(), []
+        starts.append(index)
+        signatures.append(res.value)
+        index = res.index
+
+    prog = ast.Program(
+        start=G.position(tokens, 0),
+        end=G.position(tokens, len(tokens)),
+        decls=signatures,
+    )
+    return prog, starts
+
+
+def parse_function(tokens: L.TokenStream, index: int) -> ast.Node:
+    """The full FunctionDeclaration starting at a token index, or ast.Nothing on a parse error."""
+    res = G.deep(function, tokens, index)
+    G.clear_memo()
+    if not res.status:
+        add_parse_error(tokens, res.expected, res.furthest)
+        return ast.Nothing()
+    return res.value
+
+
+def function_stream(prog: str) -> typing.Iterator[ast.Node]:
+    """Parses the program one function at a time. The first item is a Program made of the
+    signatures of all the functions (with empty bodies), then full FunctionDeclarations follow.
+    On a parse error, ast.Nothing is yielded and the stream ends."""
+    tokens = L.tokenize(prog)
+    signatures, starts = parse_signatures(tokens)
+    yield signatures
+    for index in starts:
+        fn = parse_function(tokens, index)
+        yield fn
+        if isinstance(fn, ast.Nothing):
+            return
@@ -2,16 +2,16 @@ from . import general as G
 from .. import ast
 
 
-int_t = G.addpos(G.rword("int").map(lambda e: ast.Int()))
+int_t = G.rword("int").result(ast.int_t)
 
 
-boolean_t = G.addpos(G.rword("boolean").map(lambda e: ast.Bool()))
+boolean_t = G.rword("boolean").result(ast.bool_t)
 
 
-string_t = G.addpos(G.rword("string").map(lambda e: ast.String()))
+string_t = G.rword("string").result(ast.string_t)
 
 
-void_t = G.addpos(G.rword("void").map(lambda e: ast.Void()))
+void_t = G.rword("void").result(ast.void_t)
 
 
 type = (int_t | boolean_t | string_t | void_t).desc("type literal")
@@ -0,0 +1,94 @@
+import typing
+import attr
+from . import ast, context, errors, traverse
+
+
+Hook = typing.Callable[[ast.Node], typing.Optional[ast.Node]]
+
+
+@attr.s(frozen=True, auto_attribs=True, kw_only=True)
+class Pass:
+    name: str
+    # compilation stage the errors of the pass are reported at, a pass only takes effect when all
+    # of the passes of the earlier stages succeeded
+    stage: int
+    pre_order: typing.List[Hook] = attr.ib(factory=list)
+    post_order: typing.List[Hook] = attr.ib(factory=list)
+    # passes whose hooks have to run on a node before the hooks of this one
+    after: typing.List[str] = attr.ib(factory=list)
+    # passes which have to finish walking the whole tree before this one starts
+    after_walk: typing.List[str] = attr.ib(factory=list)
+    setup: typing.Optional[typing.Callable[[ast.Node], None]] = None
+
+
+def schedule(pipeline: typing.List[Pass]) -> typing.List[typing.List[Pass]]:
+    """Groups the passes into as few walks as the dependencies allow, keeping their order.
+    Dependencies missing from the pipeline are assumed to have run before."""
+    walks: typing.List[typing.List[Pass]] = []
+    names = set(p.name for p in pipeline)
+    done: typing.Set[str] = set()
+    for p in pipeline:
+        assert all(
+            dep in done for dep in p.after + p.after_walk if dep in names
+        ), f"{p.name} scheduled before its dependencies"
+        if not walks or any(dep in (e.name for e in walks[-1]) for dep in p.after_walk):
+            walks.append([])
+        walks[-1].append(p)
+        done.add(p.name)
+    return walks
+
+
+def _gated(hook: Hook, stage: int, deferred: typing.Dict[int, typing.List[errors.Error]]) -> Hook:
+    # hooks of a later stage sharing a walk are skipped once an earlier stage fails, and their
+    # errors are held back until the earlier stages are known to have succeeded
+    def impl(node: ast.Node) -> typing.Optional[ast.Node]:
+        if errors.errors() or any(deferred[s] for s in deferred if s < stage):
+            return None
+        reported = errors.errors()
+        n = len(reported)
+        ret = hook(node)
+        if len(reported) != n:
+            deferred[stage].extend(reported[n:])
+            del reported[n:]
+        return ret
+    return impl
+
+
+def run(
+    tree: ast.Node,
+    pipeline: typing.List[Pass],
+    check: typing.Callable[[int], None] = lambda stage: None,
+) -> ast.Node:
+    """Runs the passes over the tree in fused walks. After each walk, check is called for every
+    stage of the walk in order, with the errors of the first failing stage reported."""
+    for walk in schedule(pipeline):
+        stages = sorted(set(p.stage for p in walk))
+        deferred: typing.Dict[int, typing.List[errors.Error]] = {s: [] for s in stages[1:]}
+
+        def hooks(p: Pass, hs: typing.List[Hook]) -> typing.List[Hook]:
+            if p.stage == stages[0]:
+                return hs
+            return [_gated(h, p.stage, deferred) for h in hs]
+
+        for p in walk:
+            if p.setup is not None:
+                p.setup(tree)
+        ctx = context.current()
+        ctx.walk_log.append([p.name for p in walk])
+        visits: typing.List[Hook] = []
+        if ctx.telemetry.enabled:
+            visits.append(lambda node: ctx.telemetry.count("nodes visited"))  # type: ignore
+        tree = traverse.traverse(
+            tree,
+            pre_order=visits + [h for p in walk for h in hooks(p, p.pre_order)],
+            post_order=[h for p in walk for h in hooks(p, p.post_order)],
+        )
+
+        for s in stages:
+            if not errors.errors():
+                for e in deferred.get(s, []):
+                    errors.add_error(e)
+            check(s)
+        if errors.errors():
+            break
+    return tree
@@ -1,29 +1,30 @@
+import typing
 from . import ast
 
 
-unary_bool = ast.Function(params=[ast.Bool()], ret=ast.Bool())
-unary_int = ast.Function(params=[ast.Int()], ret=ast.Int())
-binary_bool = ast.Function(params=[ast.Bool(), ast.Bool()], ret=ast.Bool())
-binary_int = ast.Function(params=[ast.Int(), ast.Int()], ret=ast.Int())
-binary_int_bool = ast.Function(params=[ast.Int(), ast.Int()], ret=ast.Bool())
-binary_string_bool = ast.Function(params=[ast.String(), ast.String()], ret=ast.Bool())
-binary_string = ast.Function(params=[ast.String(), ast.String()], ret=ast.String())
+unary_bool = ast.function_t([ast.bool_t], ast.bool_t)
+unary_int = ast.function_t([ast.int_t], ast.int_t)
+binary_bool = ast.function_t([ast.bool_t, ast.bool_t], ast.bool_t)
+binary_int = ast.function_t([ast.int_t, ast.int_t], ast.int_t)
+binary_int_bool = ast.function_t([ast.int_t, ast.int_t], ast.bool_t)
+binary_string_bool = ast.function_t([ast.string_t, ast.string_t], ast.bool_t)
+binary_string = ast.function_t([ast.string_t, ast.string_t], ast.string_t)
 
 prelude_types = [
-    ("error", ast.Function(params=[], ret=ast.Void())),
-    ("printInt", ast.Function(params=[ast.Int()], ret=ast.Void())),
-    ("printString", ast.Function(params=[ast.String()], ret=ast.Void())),
-    ("error", ast.Function(params=[], ret=ast.Void())),
-    ("readInt", ast.Function(params=[], ret=ast.Int())),
-    ("readString", ast.Function(params=[], ret=ast.String())),
-    ("__builtin__addref_string", ast.Function(params=[ast.String()], ret=ast.Void())),
-    ("__builtin__delref_string", ast.Function(params=[ast.String()], ret=ast.Void())),
+    ("error", ast.function_t([], ast.void_t)),
+    ("printInt", ast.function_t([ast.int_t], ast.void_t)),
+    ("printString", ast.function_t([ast.string_t], ast.void_t)),
+    ("error", ast.function_t([], ast.void_t)),
+    ("readInt", ast.function_t([], ast.int_t)),
+    ("readString", ast.function_t([], ast.string_t)),
+    ("__builtin__addref_string", ast.function_t([ast.string_t], ast.void_t)),
+    ("__builtin__delref_string", ast.function_t([ast.string_t], ast.void_t)),
     ("__builtin__unary_minus", unary_int),
     ("__builtin__unary_not", unary_bool),
     ("__builtin__mod", binary_int),
     ("__builtin__mul", binary_int),
     ("__builtin__div", binary_int),
-    ("__builtin__add", ast.TypeAlternative(alt=[binary_int, binary_string])),
+    ("__builtin__add", ast.alternative_t([binary_int, binary_string])),
     ("__builtin__add_int", binary_int),
     ("__builtin__add_string", binary_string),
     ("__builtin__sub", binary_int),
@@ -31,11 +32,11 @@ prelude_types = [
     ("__builtin__lt", binary_int_bool),
     ("__builtin__ge", binary_int_bool),
     ("__builtin__gt", binary_int_bool),
-    ("__builtin__eq", ast.TypeAlternative(alt=[binary_int_bool, binary_string_bool, binary_bool])),
+    ("__builtin__eq", ast.alternative_t([binary_int_bool, binary_string_bool, binary_bool])),
     ("__builtin__eq_int", binary_int_bool),
     ("__builtin__eq_string", binary_string_bool),
     ("__builtin__eq_bool", binary_bool),
-    ("__builtin__ne", ast.TypeAlternative(alt=[binary_int_bool, binary_string_bool, binary_bool])),
+    ("__builtin__ne", ast.alternative_t([binary_int_bool, binary_string_bool, binary_bool])),
     ("__builtin__ne_int", binary_int_bool),
     ("__builtin__ne_string", binary_string_bool),
     ("__builtin__ne_bool", binary_bool),
@@ -44,6 +45,38 @@ prelude_types = [
 ]
 
 
+# the monomorphic builtin each polymorphic one stands for, by the argument types of the call
+monomorphic_builtins = {
+    ("__builtin__add", (ast.int_t, ast.int_t)): "__builtin__add_int",
+    ("__builtin__add", (ast.string_t, ast.string_t)): "__builtin__add_string",
+    ("__builtin__eq", (ast.int_t, ast.int_t)): "__builtin__eq_int",
+    ("__builtin__eq", (ast.string_t, ast.string_t)): "__builtin__eq_string",
+    ("__builtin__eq", (ast.bool_t, ast.bool_t)): "__builtin__eq_bool",
+    ("__builtin__ne", (ast.int_t, ast.int_t)): "__builtin__ne_int",
+    ("__builtin__ne", (ast.string_t, ast.string_t)): "__builtin__ne_string",
+    ("__builtin__ne", (ast.bool_t, ast.bool_t)): "__builtin__ne_bool",
+}
+
+
+# for overload resolution: the monomorphic builtin, and its type, of each alternative of the
+# polymorphic ones, keyed by the identities of the (canonical) argument types
+
+Overloads = typing.Dict[typing.Tuple[int, ...], typing.Tuple[str, ast.Type]]
+
+
+def _overloads() -> typing.Dict[str, Overloads]:
+    types = dict(prelude_types)
+    ret: typing.Dict[str, Overloads] = {}
+    for (name, params), mono in monomorphic_builtins.items():
+        mono_t = types[mono]
+        assert isinstance(mono_t, ast.Function) and mono_t.params == list(params)
+        ret.setdefault(name, {})[tuple(map(id, params))] = (mono, mono_t)
+    return ret
+
+
+overloads = _overloads()
+
+
 # for constexpr folding
 
 const_fn_impls = {
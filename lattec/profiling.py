@@ -0,0 +1,246 @@
+import cProfile
+import collections
+import os
+import pstats
+import sys
+import threading
+import typing
+import attr
+
+# profiles of the stages of a compilation, written to a directory as
+#     STAGE.pstats        the cProfile statistics of the stage, for pstats or snakeviz
+#     STAGE.collapsed     its stacks in the collapsed format of flamegraph.pl and speedscope
+#     all.collapsed       the stacks of all the stages, under a frame naming the stage
+#     walks.txt           the time of the stages walking the tree, split between traverse and
+#                         the hooks of the passes
+# cProfile only records call edges, so its stacks are made by splitting the time of every function
+# among its callers in proportion; the sampling mode records real stacks, and no pstats
+
+
+_package = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def frame_name(file: str, line: int, function: str) -> str:
+    return f"{function} ({os.path.basename(file)}:{line})"
+
+
+def collapsed_profile(stats: pstats.Stats) -> typing.Dict[str, int]:
+    """Stacks of the profile weighted by microseconds of their own time."""
+    entries = stats.stats  # type: ignore
+    callees: typing.DefaultDict[typing.Any, typing.Dict[typing.Any, float]] = \
+        collections.defaultdict(dict)
+    for f, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, edge_ct) in callers.items():
+            callees[caller][f] = edge_ct
+
+    ret: typing.DefaultDict[str, int] = collections.defaultdict(int)
+    # the part of the cumulative time of a function spent under the stack leading to it
+    todo: typing.List[typing.Tuple[typing.Tuple[typing.Any, ...], float]] = [
+        ((f,), 1.0) for f, e in entries.items() if not e[4]
+    ]
+    while todo:
+        path, share = todo.pop()
+        f = path[-1]
+        _, _, tt, ct, _ = entries[f]
+        stack = ";".join(frame_name(*e) for e in path)
+        if tt * share >= 1e-6:
+            ret[stack] += int(tt * share * 1e6)
+        for callee, edge_ct in callees[f].items():
+            callee_ct = entries[callee][3]
+            sub = share * edge_ct / callee_ct if callee_ct > 0 else 0.0
+            # recursion is folded into the first call, tiny branches are dropped
+            if callee not in path and entries[callee][3] * sub >= 1e-6:
+                todo.append((path + (callee,), sub))
+    return ret
+
+
+def _walk_frame(f: typing.Tuple[str, int, str], module: str) -> bool:
+    return os.path.basename(f[0]) == module
+
+
+def _hook_frame(f: typing.Tuple[str, int, str]) -> bool:
+    # the hooks are the functions of the compiler called by traverse other than its own
+    return f[0].startswith(_package) and not _walk_frame(f, "traverse.py")
+
+
+def walk_times(stats: pstats.Stats) -> typing.Tuple[float, typing.Dict[str, float]]:
+    """The time spent walking trees in traverse.traverse, not counting the hooks called on the
+    nodes, and the time of each hook. The hooks gated by passes.run are looked through, what
+    traverse does to rebuild the nodes counts as walking."""
+    entries = stats.stats  # type: ignore
+    callees: typing.DefaultDict[typing.Any, typing.Dict[typing.Any, float]] = \
+        collections.defaultdict(dict)
+    for f, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, edge_ct) in callers.items():
+            callees[caller][f] = edge_ct
+
+    walking = sum(e[3] for f, e in entries.items() if _walk_frame(f, "traverse.py") and
+                  f[2] == "traverse")
+    hooks: typing.Dict[str, float] = collections.defaultdict(float)
+    for f in entries:
+        if not _walk_frame(f, "traverse.py") or f[2] != "traverse_impl":
+            continue
+        for hook, ct in callees[f].items():
+            if not _hook_frame(hook):
+                continue
+            if _walk_frame(hook, "passes.py"):
+                for gated, gated_ct in callees[hook].items():
+                    if _hook_frame(gated) and not _walk_frame(gated, "errors.py"):
+                        hooks[frame_name(*gated)] += gated_ct
+                continue
+            hooks[frame_name(*hook)] += ct
+    return walking - sum(hooks.values()), hooks
+
+
+def on_thread(f: typing.Callable, *args: typing.Any) -> typing.Any:
+    # a frame the stacks of a stage moved to another thread start from, recursive functions not
+    # making roots for collapsed_profile
+    return f(*args)
+
+
+class _Exported:
+    # what pstats.Stats loads a profile from
+    def __init__(self, stats: dict) -> None:
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Profiler:
+    """Profiles the stages of telemetry.Telemetry, which starts and stops them. A stage may move
+    to another thread meanwhile (general.deep), then the profiling moves along with it."""
+    sampling: bool = False
+    interval: float = 0.001
+    profiles: typing.Dict[str, cProfile.Profile] = attr.ib(factory=dict)
+    # from profiles of other processes, see export
+    imported: typing.Dict[str, typing.List[dict]] = attr.ib(factory=dict)
+    samples: typing.Counter[str] = attr.ib(factory=collections.Counter)
+    stage: typing.Optional[str] = None
+    thread: int = 0
+    sampler: typing.Optional[threading.Thread] = None
+    done: threading.Event = attr.ib(factory=threading.Event)
+
+    def enter(self, stage: str) -> None:
+        self.stage = stage
+        self.thread = threading.get_ident()
+        if not self.sampling:
+            self.profiles.setdefault(stage, cProfile.Profile()).enable()
+        elif self.sampler is None:
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+
+    def leave(self) -> None:
+        if not self.sampling:
+            self.profiles[self.stage].disable()  # type: ignore
+        self.stage = None
+
+    def run_here(self, f: typing.Callable, *args: typing.Any) -> typing.Any:
+        """Runs f in the current thread as part of the stage, the thread which was running it
+        waiting meanwhile."""
+        if self.stage is None:
+            return f(*args)
+        thread = self.thread
+        self.thread = threading.get_ident()
+        # a profile may only be enabled in one thread at once
+        profile = None if self.sampling else self.profiles[self.stage]
+        try:
+            if profile is not None:
+                profile.enable()
+            return on_thread(f, *args)
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.thread = thread
+
+    def pause(self) -> None:
+        if self.stage is not None and not self.sampling:
+            self.profiles[self.stage].disable()
+
+    def resume(self) -> None:
+        if self.stage is not None and not self.sampling:
+            self.profiles[self.stage].enable()
+
+    def sample(self) -> None:
+        while not self.done.wait(self.interval):
+            stage = self.stage
+            frame = sys._current_frames().get(self.thread)
+            if stage is None or frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(frame_name(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            self.samples[stage + ";" + ";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self.done.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+
+    def export(self) -> typing.Tuple[typing.Dict[str, dict], typing.Dict[str, int]]:
+        """What merge takes in another process, the profiles so far are dropped."""
+        stats = {}
+        for stage, profile in self.profiles.items():
+            profile.create_stats()
+            stats[stage] = profile.stats  # type: ignore
+        self.profiles.clear()
+        samples = dict(self.samples)
+        self.samples.clear()
+        return stats, samples
+
+    def merge(self, exported: typing.Tuple[typing.Dict[str, dict], typing.Dict[str, int]]) -> None:
+        stats, samples = exported
+        for stage, s in stats.items():
+            self.imported.setdefault(stage, []).append(s)
+        self.samples.update(samples)
+
+    def stage_stats(self) -> typing.Dict[str, pstats.Stats]:
+        ret: typing.Dict[str, pstats.Stats] = {}
+        for stage in list(self.profiles) + [s for s in self.imported if s not in self.profiles]:
+            sources: typing.List[typing.Any] = [_Exported(s) for s in self.imported.get(stage, [])]
+            if stage in self.profiles:
+                sources.insert(0, self.profiles[stage])
+            ret[stage] = pstats.Stats(*sources)
+        return ret
+
+    def write(self, directory: str) -> None:
+        self.stop()
+        os.makedirs(directory, exist_ok=True)
+        stacks: typing.Dict[str, typing.Dict[str, int]] = collections.defaultdict(dict)
+        walks = []
+        for stage, stats in self.stage_stats().items():
+            stats.dump_stats(os.path.join(directory, f"{stage}.pstats"))
+            stacks[stage] = collapsed_profile(stats)
+            walking, hooks = walk_times(stats)
+            if hooks:
+                walks.append(f"{stage}: {walking * 1000:.1f} ms walking the tree, "
+                             f"{sum(hooks.values()) * 1000:.1f} ms in the hooks")
+                walks.extend(
+                    f"    {t * 1000:8.1f} ms  {hook}"
+                    for hook, t in sorted(hooks.items(), key=lambda e: -e[1])
+                )
+        if walks:
+            with open(os.path.join(directory, "walks.txt"), "w") as f:
+                f.write("".join(line + "\n" for line in walks))
+        for key, cnt in self.samples.items():
+            stage, stack = key.split(";", 1)
+            stacks[stage][stack] = cnt
+
+        everything: typing.List[str] = []
+        for stage, st in stacks.items():
+            lines = [f"{stack} {n}" for stack, n in sorted(st.items())]
+            with open(os.path.join(directory, f"{stage}.collapsed"), "w") as f:
+                f.write("".join(line + "\n" for line in lines))
+            everything.extend(f"{stage};{line}" for line in lines)
+        with open(os.path.join(directory, "all.collapsed"), "w") as f:
+            f.write("".join(line + "\n" for line in everything))
+
+
+def of(cfg: dict) -> typing.Optional[Profiler]:
+    if not cfg["profile"]:
+        return None
+    return Profiler(sampling=cfg["profile_mode"] == "sample", interval=cfg["profile_interval"])
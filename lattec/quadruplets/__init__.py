@@ -1,3 +1,25 @@
-from .engine import quadruplet_generation  # noqa
-from .memassignment import assignment_elimination_mem  # noqa
-from .pruning import pruning  # noqa
+import typing
+from .. import lazy
+
+if typing.TYPE_CHECKING:
+    from .engine import quadruplet_generation, quadruplet_pass, signature_generation  # noqa
+    from .generator import lowered  # noqa
+    from .memassignment import assignment_elimination_mem, eliminate_fn  # noqa
+    from .pruning import pruning, prune  # noqa
+    from .sccp import propagation, propagate  # noqa
+    from .ssa import promotion, promote  # noqa
+
+__getattr__ = lazy.exports(__name__, {
+    "quadruplet_generation": "engine",
+    "quadruplet_pass": "engine",
+    "signature_generation": "engine",
+    "lowered": "generator",
+    "assignment_elimination_mem": "memassignment",
+    "eliminate_fn": "memassignment",
+    "pruning": "pruning",
+    "prune": "pruning",
+    "propagation": "sccp",
+    "propagate": "sccp",
+    "promotion": "ssa",
+    "promote": "ssa",
+})
@@ -0,0 +1,270 @@
+import typing
+import attr
+from .. import quads as Q
+
+# the control flow graph of a function: its blocks in the order of the body, each one a label, the
+# quads after it and the branch or return ending it, with the blocks it may go to and come from.
+# Quads after the end of a block never run and are left out. The edits below keep the edges up to
+# date; what is computed from them (reverse postorder, dominators, loops) only covers the blocks
+# reached from the entry, is computed on first use and forgotten on the next edit.
+
+
+def targets(q: Q.Quad) -> typing.List[str]:
+    if isinstance(q, Q.Branch):
+        return [q.target.name]
+    if isinstance(q, Q.CondBranch):
+        return [q.target_true.name, q.target_false.name]
+    return []
+
+
+def _ends(q: Q.Quad) -> bool:
+    return isinstance(q, (Q.Branch, Q.CondBranch, Q.Return))
+
+
+@attr.s(auto_attribs=True, kw_only=True, eq=False)
+class Block:
+    # starting with the label
+    quads: typing.List[Q.Quad]
+    # a block branching here on both of its targets comes twice, as LLVM counts predecessors
+    preds: typing.List[str] = attr.ib(factory=list)
+    succs: typing.List[str] = attr.ib(factory=list)
+
+    @property
+    def name(self) -> str:
+        return self.quads[0].name  # type: ignore
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Loop:
+    header: str
+    # the header of the innermost loop around this one
+    parent: typing.Optional[str]
+    depth: int
+    # with the blocks of the loops nested in it, in reverse postorder
+    blocks: typing.List[str] = attr.ib(factory=list)
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class CFG:
+    blocks: typing.Dict[str, Block]
+    analyses: typing.Dict[str, typing.Any] = attr.ib(factory=dict)
+
+    def body(self) -> typing.List[Q.Quad]:
+        return [q for b in self.blocks.values() for q in b.quads]
+
+    # EDITS
+
+    def set_end(self, name: str, q: Q.Quad) -> None:
+        """Makes q the branch or return ending the block."""
+        b = self.blocks[name]
+        for t in b.succs:
+            self.blocks[t].preds.remove(name)
+        if _ends(b.quads[-1]):
+            b.quads[-1] = q
+        else:
+            b.quads.append(q)
+        b.succs = targets(q)
+        for t in b.succs:
+            self.blocks[t].preds.append(name)
+        self.analyses.clear()
+
+    def remove(self, name: str) -> None:
+        """Removes the block, which nothing should branch to any more but removed blocks."""
+        b = self.blocks.pop(name)
+        for t in b.succs:
+            if t in self.blocks:
+                self.blocks[t].preds.remove(name)
+        for p in b.preds:
+            if p in self.blocks:
+                self.blocks[p].succs = [t for t in self.blocks[p].succs if t != name]
+        self.analyses.clear()
+
+    def remove_unreachable(self) -> int:
+        """Removes the blocks not reached from the entry, returning how many there were."""
+        number = self.number()
+        dead = [name for name in self.blocks if name not in number]
+        analyses = dict(self.analyses)
+        for name in dead:
+            self.remove(name)
+        # they only ever covered the blocks left
+        self.analyses.update(analyses)
+        return len(dead)
+
+    # ANALYSES
+
+    def order(self) -> typing.List[str]:
+        """The blocks reached from the entry in reverse postorder, every one after its
+        dominators."""
+        if "order" not in self.analyses:
+            order = []
+            seen = {"entry"}
+            stack = [("entry", iter(self.blocks["entry"].succs))]
+            while stack:
+                name, succs = stack[-1]
+                for s in succs:
+                    if s not in seen:
+                        seen.add(s)
+                        stack.append((s, iter(self.blocks[s].succs)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(name)
+            order.reverse()
+            self.analyses["order"] = order
+            self.analyses["number"] = {name: no for no, name in enumerate(order)}
+        return self.analyses["order"]
+
+    def number(self) -> typing.Dict[str, int]:
+        """The positions of the blocks reached in order."""
+        self.order()
+        return self.analyses["number"]
+
+    def idom(self) -> typing.Dict[str, str]:
+        """The immediate dominators (Cooper, Harvey and Kennedy), the entry being its own."""
+        if "idom" not in self.analyses:
+            order, number = self.order(), self.number()
+            preds = [[number[p] for p in self.blocks[b].preds if p in number] for b in order]
+            idom = [-1] * len(order)
+            idom[0] = 0
+
+            def intersect(a: int, b: int) -> int:
+                while a != b:
+                    while a > b:
+                        a = idom[a]
+                    while b > a:
+                        b = idom[b]
+                return a
+
+            changed = True
+            while changed:
+                changed = False
+                for b in range(1, len(order)):
+                    new = -1
+                    for p in preds[b]:
+                        if idom[p] != -1:
+                            new = p if new == -1 else intersect(p, new)
+                    if idom[b] != new:
+                        idom[b] = new
+                        changed = True
+            self.analyses["idom"] = {name: order[idom[no]] for no, name in enumerate(order)}
+        return self.analyses["idom"]
+
+    def dominator_tree(self) -> typing.Dict[str, typing.List[str]]:
+        """The blocks immediately dominated by each one, in order."""
+        if "children" not in self.analyses:
+            children: typing.Dict[str, typing.List[str]] = {name: [] for name in self.order()}
+            for name in self.order()[1:]:
+                children[self.idom()[name]].append(name)
+            self.analyses["children"] = children
+        return self.analyses["children"]
+
+    def dominates(self, a: str, b: str) -> bool:
+        """Whether every path from the entry to b goes through a, both being reached."""
+        if "span" not in self.analyses:
+            # the preorder number of every block and of the last block it dominates
+            span: typing.Dict[str, typing.Tuple[int, int]] = {}
+            children = self.dominator_tree()
+            stack = ["entry"]
+            pre: typing.Dict[str, int] = {}
+            while stack:
+                name = stack.pop()
+                pre[name] = len(pre)
+                stack.extend(reversed(children[name]))
+            for name in reversed(self.order()):
+                last = max((span[c][1] for c in children[name]), default=pre[name])
+                span[name] = (pre[name], last)
+            self.analyses["span"] = span
+        span = self.analyses["span"]
+        return span[a][0] <= span[b][0] <= span[a][1]
+
+    def frontiers(self) -> typing.Dict[str, typing.Set[str]]:
+        """The dominance frontier of every block: where its dominance ends, at the blocks with
+        another predecessor it does not dominate."""
+        if "frontiers" not in self.analyses:
+            idom, number = self.idom(), self.number()
+            df: typing.Dict[str, typing.Set[str]] = {name: set() for name in self.order()}
+            for name in self.order():
+                preds = [p for p in self.blocks[name].preds if p in number]
+                if len(preds) < 2:
+                    continue
+                for p in preds:
+                    while p != idom[name]:
+                        df[p].add(name)
+                        p = idom[p]
+            self.analyses["frontiers"] = df
+        return self.analyses["frontiers"]
+
+    def loops(self) -> typing.Dict[str, Loop]:
+        """The natural loops by their headers, the targets of the back edges. The loops nesting
+        in each other are found innermost first, their headers coming last in order."""
+        if "loops" not in self.analyses:
+            number = self.number()
+            # the innermost loop of every block in one, and the loops found so far
+            innermost: typing.Dict[str, str] = {}
+            parents: typing.Dict[str, typing.Optional[str]] = {}
+
+            def outermost(name: str) -> str:
+                # the block, or the header of the outermost loop around it found so far
+                if name not in innermost:
+                    return name
+                h = innermost[name]
+                while parents[h] is not None:
+                    h = parents[h]  # type: ignore
+                return h
+
+            for h in reversed(self.order()):
+                latches = [p for p in self.blocks[h].preds if p in number and self.dominates(h, p)]
+                if not latches:
+                    continue
+                innermost[h] = h
+                parents[h] = None
+                work = latches
+                while work:
+                    name = outermost(work.pop())
+                    if name == h:
+                        continue
+                    if name in parents:
+                        parents[name] = h
+                    else:
+                        innermost[name] = h
+                    work.extend(
+                        p for p in self.blocks[name].preds if p in number and self.dominates(h, p))
+
+            loops: typing.Dict[str, Loop] = {}
+            for h in self.order():
+                if h in parents:
+                    parent = parents[h]
+                    depth = 1 if parent is None else loops[parent].depth + 1
+                    loops[h] = Loop(header=h, parent=parent, depth=depth)
+            for name in self.order():
+                around = innermost.get(name)
+                while around is not None:
+                    loops[around].blocks.append(name)
+                    around = loops[around].parent
+            self.analyses["loops"] = loops
+            self.analyses["innermost"] = innermost
+        return self.analyses["loops"]
+
+    def loop_of(self, name: str) -> typing.Optional[Loop]:
+        """The innermost loop the block is in, if any."""
+        loops = self.loops()
+        h = self.analyses["innermost"].get(name)
+        return None if h is None else loops[h]
+
+
+def of(body: typing.List[Q.Quad]) -> CFG:
+    """The graph of a function body starting with its entry label."""
+    blocks: typing.Dict[str, Block] = {}
+    cur: typing.Optional[Block] = None
+    for q in body:
+        if isinstance(q, Q.Label):
+            cur = blocks[q.name] = Block(quads=[q])
+        elif cur is not None:
+            cur.quads.append(q)
+            if _ends(q):
+                cur.succs = targets(q)
+                cur = None
+    for name, b in blocks.items():
+        for t in b.succs:
+            blocks[t].preds.append(name)
+    return CFG(blocks=blocks)
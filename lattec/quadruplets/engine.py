@@ -1,17 +1,44 @@
-from .. import ast, traverse
+import typing
+from .. import ast, context, passes, prelude
 from .. import quads as Q
-from . import generator, scopes
-
-
-def quadruplet_generation(tree: ast.Program) -> Q.Program:
-    traverse.traverse(
-        tree,
-        pre_order=[
-            scopes.infer_scopes_pre,
-        ],
-        post_order=[
-            generator.gen_quads_post,
-            scopes.infer_scopes_post,
-        ]
-    )
-    return tree.attrs.quad_gen()  # type: ignore
+from . import generator
+
+
+def _setup(tree: ast.Node) -> None:
+    ctx = context.current()
+    # the slots of the names resolved by the analysis of the tree
+    ctx.slot_vars = [None] * ctx.scopes.slot_cnt
+    if isinstance(tree, ast.Program):
+        signature_generation(tree)
+
+
+# variables are allocated as their declarations are met, so the tree has to be fully folded
+# beforehand
+quadruplet_pass = passes.Pass(
+    name="quadruplets",
+    stage=3,
+    post_order=[
+        generator.gen_quads_post,
+    ],
+    after_walk=["types", "constexprs", "returns"],
+    setup=_setup,
+)
+
+
+def signature_generation(tree: ast.Program) -> ast.Program:
+    # global part of quadruplet_generation, for programs lowered one function at a time afterwards
+    global_vars = context.current().global_vars
+    global_vars.clear()
+    for v, t in prelude.prelude_types + [(e.name, e.type) for e in tree.decls]:
+        if isinstance(t, ast.TypeAlternative):
+            pass  # we ignore the polymorphic ones - should be eliminated
+        else:
+            global_vars[v] = Q.GlobalVar(Q.from_ast_type(t), v)
+    return tree
+
+
+def quadruplet_generation(
+    tree: ast.Node
+) -> typing.Union[Q.Program, Q.Function]:
+    ret = passes.run(tree, [quadruplet_pass])
+    return generator.lowered(ret)
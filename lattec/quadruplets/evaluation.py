@@ -0,0 +1,171 @@
+import typing
+import attr
+from .. import context, prelude
+from .. import quads as Q
+
+# evaluation at compile time, of the builtins of prelude.const_fn_impls and of the pure functions
+# of the program, those calling nothing but them and each other: no input or output, no error().
+# The functions run after memassignment, on an interpreter of their quads with a budget of steps.
+
+
+# the result of a call which cannot be known at compile time
+class _Unknown:
+    def __repr__(self) -> str:
+        return "unknown"
+
+
+unknown = _Unknown()
+
+Constant = typing.Union[Q.Constant, Q.SConstant]
+
+# reference counting of strings, the values at compile time need none
+_refcounting = {"__builtin__addref_string", "__builtin__delref_string"}
+
+
+# longer strings are left to be built at run time, each one computed here is kept until the end
+_string_limit = 4096
+
+
+def _int32(v: int) -> int:
+    return (v + 2**31) % 2**32 - 2**31
+
+
+def _wrapped(c: typing.Any) -> typing.Any:
+    # an int returned is an i32 of the caller, whatever computed it
+    if isinstance(c, Q.Constant) and isinstance(c.type, Q.I32):
+        return Q.Constant(c.type, _int32(c.value))
+    return c
+
+
+def evaluated(name: str, args: typing.List[typing.Any], t: Q.RegType) -> typing.Any:
+    """The result of a builtin on constants, if it is the one computed at run time."""
+    if name in ("__builtin__div", "__builtin__mod") and (args[1] == 0 or min(args) < 0):
+        # division by zero is left to fail at run time, and sdiv / srem round towards zero
+        return unknown
+    ret = prelude.const_fn_impls[name](*args)  # type: ignore
+    if isinstance(t, Q.String):
+        return Q.SConstant(t, ret) if len(ret) <= _string_limit else unknown
+    if isinstance(t, Q.I32):
+        ret = _int32(ret)
+    return Q.Constant(t, ret)
+
+
+def pure_functions(p: Q.Program) -> typing.Dict[str, Q.Function]:
+    functions = {f.name: f for f in p}
+    callees = {
+        f.name: set(q.function.name for q in f.body if isinstance(q, Q.Call))  # type: ignore
+        for f in p
+    }
+    pure = set(functions)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if any(
+                c not in pure and c not in prelude.const_fn_impls and c not in _refcounting
+                for c in callees[name]
+            ):
+                pure.remove(name)
+                changed = True
+    return {name: functions[name] for name in pure}
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class _Frame:
+    function: Q.Function
+    args: typing.Tuple[Constant, ...]
+    pc: int = 0
+    regs: typing.Dict[str, Constant] = attr.ib(factory=dict)
+    memory: typing.Dict[str, Constant] = attr.ib(factory=dict)
+    # the variable of the caller getting the result
+    result: typing.Optional[str] = None
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Evaluator:
+    """Evaluates calls of the pure functions, each one in at most steps steps, all of them in at
+    most ten times that. Results are remembered, so recursion on the same arguments is cheap."""
+    functions: typing.Dict[str, Q.Function]
+    steps: int
+    remaining: int = 0
+    results: typing.Dict[typing.Tuple[str, typing.Tuple[Constant, ...]], typing.Any] = \
+        attr.ib(factory=dict)
+    labels: typing.Dict[str, typing.Dict[str, int]] = attr.ib(factory=dict)
+
+    def __attrs_post_init__(self) -> None:
+        self.remaining = 10 * self.steps
+        for name, f in self.functions.items():
+            self.labels[name] = {q.name: i for i, q in enumerate(f.body) if isinstance(q, Q.Label)}
+
+    def pure(self, name: str) -> bool:
+        return name in self.functions
+
+    def call(self, name: str, args: typing.List[Constant]) -> typing.Any:
+        key = (name, tuple(args))
+        if key not in self.results:
+            context.current().telemetry.count("calls evaluated")
+            budget = min(self.steps, self.remaining)
+            ret, used = self.run(self.frame(name, key[1]), budget)
+            self.remaining -= used
+            self.results[key] = _wrapped(ret)
+        return self.results[key]
+
+    def frame(self, name: str, args: typing.Tuple[Constant, ...]) -> _Frame:
+        f = self.functions[name]
+        return _Frame(function=f, args=args, regs={p.name: a for p, a in zip(f.params, args)})
+
+    def run(self, frame: _Frame, budget: int) -> typing.Tuple[typing.Any, int]:
+        # the calls are kept on a stack of frames, deep recursion does not hit the Python limit
+        stack = [frame]
+        steps = 0
+        while steps < budget:
+            steps += 1
+            fr = stack[-1]
+            q = fr.function.body[fr.pc]
+            fr.pc += 1
+            try:
+                if isinstance(q, Q.Store):
+                    fr.memory[q.target.name] = self.value(fr, q.source)
+                elif isinstance(q, Q.Load):
+                    fr.regs[q.target.name] = fr.memory[q.source.name]  # type: ignore
+                elif isinstance(q, Q.Branch):
+                    fr.pc = self.labels[fr.function.name][q.target.name]
+                elif isinstance(q, Q.CondBranch):
+                    target = q.target_true if self.value(fr, q.cond).value else q.target_false
+                    fr.pc = self.labels[fr.function.name][target.name]
+                elif isinstance(q, Q.Return):
+                    ret = None if q.val is None else _wrapped(self.value(fr, q.val))
+                    self.results[(fr.function.name, fr.args)] = ret
+                    stack.pop()
+                    if not stack:
+                        return ret, steps
+                    if fr.result is not None:
+                        stack[-1].regs[fr.result] = ret  # type: ignore
+                elif isinstance(q, Q.Call):
+                    name = q.function.name  # type: ignore
+                    if name in _refcounting:
+                        continue
+                    args = tuple(self.value(fr, p) for p in q.params)
+                    if name in prelude.const_fn_impls:
+                        assert q.target is not None
+                        ret = evaluated(name, [a.value for a in args], q.target.type)
+                    elif (name, args) in self.results:
+                        ret = self.results[(name, args)]
+                    else:
+                        callee = self.frame(name, args)
+                        callee.result = None if q.target is None else q.target.name
+                        stack.append(callee)
+                        continue
+                    if ret is unknown:
+                        return unknown, steps
+                    if q.target is not None:
+                        fr.regs[q.target.name] = ret
+            except (KeyError, ZeroDivisionError):
+                # a value never set, as in an unreachable or undefined path
+                return unknown, steps
+        return unknown, steps
+
+    def value(self, frame: _Frame, v: Q.Val) -> Constant:
+        if isinstance(v, (Q.Constant, Q.SConstant)):
+            return v
+        return frame.regs[v.name]  # type: ignore
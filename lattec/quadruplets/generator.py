@@ -1,9 +1,23 @@
 import typing
-from .. import ast
-from .scopes import var_decls
+from .. import ast, context, traverse
 from .. import quads as Q
 
 
+# quad_gen returns its result or a generator yielding the quad_gen results of the children, so
+# that deeply nested code is lowered without deep recursion
+Lowering = typing.Generator[typing.Any, typing.Any, None]
+
+
+def lowered(node: ast.Node) -> typing.Any:
+    return traverse.trampoline(node.attrs.quad_gen())
+
+
+def resolved(var: ast.Variable) -> Q.Val:
+    ctx = context.current()
+    slot = var.attrs.slot
+    return ctx.global_vars[var.var] if slot is None else ctx.slot_vars[slot]
+
+
 def gen_quads_post(node: ast.Node) -> None:
     # expressions
     if isinstance(node, ast.IConstant):
@@ -25,16 +39,16 @@ def gen_quads_post(node: ast.Node) -> None:
         node.attrs.quad_gen = impl_e
 
     if isinstance(node, ast.Variable):
-        var = var_decls[node.var][-1]
+        var = resolved(node)
 
         def impl_e() -> Q.Val:
             return var
         node.attrs.quad_gen = impl_e
 
     if isinstance(node, ast.Application):
-        def impl_e() -> Q.Val:
+        def impl_g() -> typing.Generator[typing.Any, Q.Val, Q.Val]:
             assert isinstance(node, ast.Application)
-            f = node.function.attrs.quad_gen()
+            f = yield node.function.attrs.quad_gen()
             if isinstance(f, Q.GlobalVar) and f.name in ["__builtin__and", "__builtin__or"]:
                 fst = node.args[0].attrs.quad_gen
                 snd = node.args[1].attrs.quad_gen
@@ -42,14 +56,14 @@ def gen_quads_post(node: ast.Node) -> None:
                 pos = Q.new_label()
                 neg = Q.new_label()
                 end = Q.new_label()
-                fv = fst()
+                fv = yield fst()
 
                 if f.name == "__builtin__and":
                     Q.add_quad(Q.CondBranch(fv, half, neg))
                 else:  # f.name == "__builtin__or"
                     Q.add_quad(Q.CondBranch(fv, pos, half))
                 Q.add_quad(half)
-                sv = snd()
+                sv = yield snd()
                 Q.add_quad(Q.CondBranch(sv, pos, neg))
 
                 ft = node.function.attrs.type
@@ -68,7 +82,9 @@ def gen_quads_post(node: ast.Node) -> None:
 
                 return v
             else:
-                args = [e.attrs.quad_gen() for e in node.args]
+                args = []
+                for e in node.args:
+                    args.append((yield e.attrs.quad_gen()))
                 ft = node.function.attrs.type
                 assert isinstance(ft, ast.Function)
                 v = Q.new_var(Q.from_ast_type(ft.ret))
@@ -84,35 +100,38 @@ def gen_quads_post(node: ast.Node) -> None:
                         [v]
                     ))
                 return v
-        node.attrs.quad_gen = impl_e
+        node.attrs.quad_gen = impl_g
 
     # statements
     if isinstance(node, ast.Block):
-        def impl_s() -> None:
+        def impl_s() -> Lowering:
             assert isinstance(node, ast.Block)
             Q.open_defer_scope()
             for e in node.statements:
-                e.attrs.quad_gen()
+                yield e.attrs.quad_gen()
             for q in Q.close_defer_scope():
                 Q.add_quad(q)
         node.attrs.quad_gen = impl_s
 
     if isinstance(node, ast.FreeExpression):
-        node.attrs.quad_gen = node.expr.attrs.quad_gen
+        def impl_s() -> Lowering:
+            assert isinstance(node, ast.FreeExpression)
+            yield node.expr.attrs.quad_gen()
+        node.attrs.quad_gen = impl_s
 
     if isinstance(node, ast.Declaration):
-        var = var_decls[node.var.var][-1]
+        context.current().slot_vars[node.attrs.slot] = Q.new_var(Q.from_ast_type(node.type))
 
-        def impl_s() -> None:
+        def impl_d() -> None:
             pass
-        node.attrs.quad_gen = impl_s
+        node.attrs.quad_gen = impl_d
 
     if isinstance(node, ast.Assignment):
-        var = var_decls[node.var.var][-1]
+        var = resolved(node.var)
 
-        def impl_s() -> None:
+        def impl_s() -> Lowering:
             assert isinstance(node, ast.Assignment)
-            val = node.expr.attrs.quad_gen()
+            val = yield node.expr.attrs.quad_gen()
             assert isinstance(var, Q.Var)
             if isinstance(var.type, Q.String):
                 # reusing an attr set for every first assignment
@@ -147,12 +166,12 @@ def gen_quads_post(node: ast.Node) -> None:
         node.attrs.quad_gen = impl_s
 
     if isinstance(node, ast.Return):
-        def impl_s() -> None:
+        def impl_s() -> Lowering:
             # defered calls when return happens
             assert isinstance(node, ast.Return)
             ret = None
             if node.val is not None:
-                ret = node.val.attrs.quad_gen()
+                ret = yield node.val.attrs.quad_gen()
                 # bump ref count on an object if returning a string
                 if isinstance(ret.type, Q.String):
                     Q.add_quad(Q.Call(
@@ -164,15 +183,14 @@ def gen_quads_post(node: ast.Node) -> None:
                         [ret]
                     ))
 
-            for q in sum(Q.defer_stack, []):
+            for q in Q.all_defers():
                 Q.add_quad(q)
             Q.add_quad(Q.Return(ret))
         node.attrs.quad_gen = impl_s
 
     if isinstance(node, ast.If):
-        def impl_s() -> None:
+        def impl_s() -> Lowering:
             assert isinstance(node, ast.If)
-            cond = node.cond.attrs.quad_gen
             then_branch = node.then_branch.attrs.quad_gen
             if node.else_branch is not None:
                 else_branch = node.else_branch.attrs.quad_gen
@@ -186,33 +204,32 @@ def gen_quads_post(node: ast.Node) -> None:
             if not else_branch:
                 else_lbl = end_lbl
 
-            cv = cond()
+            cv = yield node.cond.attrs.quad_gen()
             Q.add_quad(Q.CondBranch(cv, then_lbl, else_lbl))
             Q.add_quad(then_lbl)
-            then_branch()
+            yield then_branch()
             Q.add_quad(Q.Branch(end_lbl))
             if else_branch:
                 Q.add_quad(else_lbl)
-                else_branch()
+                yield else_branch()
                 Q.add_quad(Q.Branch(end_lbl))
             Q.add_quad(end_lbl)
 
         node.attrs.quad_gen = impl_s
 
     if isinstance(node, ast.While):
-        def impl_s() -> None:
+        def impl_s() -> Lowering:
             assert isinstance(node, ast.While)
-            cond = node.cond.attrs.quad_gen
             body = node.body.attrs.quad_gen
             body_lbl = Q.new_label()
             cond_lbl = Q.new_label()
             end_lbl = Q.new_label()
             Q.add_quad(Q.Branch(cond_lbl))
             Q.add_quad(body_lbl)
-            body()
+            yield body()
             Q.add_quad(Q.Branch(cond_lbl))
             Q.add_quad(cond_lbl)
-            cv = cond()
+            cv = yield node.cond.attrs.quad_gen()
             Q.add_quad(Q.CondBranch(cv, body_lbl, end_lbl))
             Q.add_quad(end_lbl)
 
@@ -220,10 +237,10 @@ def gen_quads_post(node: ast.Node) -> None:
 
     # TLDs
     if isinstance(node, ast.FunctionDeclaration):
-        params: typing.List[Q.Var] = [
-            var_decls[e.var.var][-1] for e in node.params]  # type: ignore
+        slot_vars = context.current().slot_vars
+        params: typing.List[Q.Var] = [slot_vars[e.attrs.slot] for e in node.params]
 
-        def impl_t() -> Q.Function:
+        def impl_t() -> typing.Generator[typing.Any, typing.Any, Q.Function]:
             assert isinstance(node, ast.FunctionDeclaration)
             assert isinstance(node.type, ast.Function)
 
@@ -250,7 +267,7 @@ def gen_quads_post(node: ast.Node) -> None:
                         [p]
                     ))
 
-            node.body.attrs.quad_gen()
+            yield node.body.attrs.quad_gen()
             for q in Q.close_defer_scope():
                 Q.add_quad(q)
             if isinstance(node.type.ret, ast.Void):
@@ -269,5 +286,8 @@ def gen_quads_post(node: ast.Node) -> None:
     if isinstance(node, ast.Program):
         def impl_p():
             assert isinstance(node, ast.Program)
-            return [e.attrs.quad_gen() for e in node.decls]
+            ret = []
+            for e in node.decls:
+                ret.append((yield e.attrs.quad_gen()))
+            return ret
         node.attrs.quad_gen = impl_p
@@ -0,0 +1,233 @@
+import heapq
+import typing
+import attr
+from .. import context, prelude
+from .. import quads as Q
+from . import cfg, evaluation
+
+# sparse conditional constant propagation (Wegman, Zadeck) over functions after memassignment,
+# where every variable is assigned once and the variables assigned more often live in allocas.
+# A value is unknown (not in the tables, nothing reaching it has run yet), a constant, or varying.
+# The allocas are tracked per block, as the meet of what the executable predecessors store there.
+# Variables are keyed by their names, unique in a function and much faster to hash.
+# Branches on constants become unconditional and the blocks never reached are removed. With the
+# whole program at hand, calls of its pure functions on constants are evaluated too.
+
+
+class _Varying:
+    def __repr__(self) -> str:
+        return "varying"
+
+
+varying = _Varying()
+
+Value = typing.Union[Q.Constant, Q.SConstant, _Varying]
+Memory = typing.Dict[str, typing.Optional[Value]]
+
+
+def meet(a: typing.Optional[Value], b: typing.Optional[Value]) -> typing.Optional[Value]:
+    if a is None:
+        return b
+    if b is None or a == b:
+        return a
+    return varying
+
+
+def _used(q: Q.Quad) -> typing.List[Q.Val]:
+    # the values a quad reads, other than from memory
+    if isinstance(q, Q.Call):
+        return q.params
+    if isinstance(q, Q.Store):
+        return [q.source]
+    if isinstance(q, Q.CondBranch):
+        return [q.cond]
+    if isinstance(q, Q.Return) and q.val is not None:
+        return [q.val]
+    return []
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Propagation:
+    graph: cfg.CFG
+    evaluator: typing.Optional[evaluation.Evaluator] = None
+    values: typing.Dict[str, Value] = attr.ib(factory=dict)
+    # the memory at the start of the executable blocks
+    memory: typing.Dict[str, Memory] = attr.ib(factory=dict)
+    # the blocks using each variable, to be visited again when its value drops
+    users: typing.Dict[str, typing.Set[str]] = attr.ib(factory=dict)
+    # the block of the quad defining each variable
+    defined: typing.Dict[str, str] = attr.ib(factory=dict)
+    # the blocks to visit, by their numbers in reverse postorder
+    order: typing.Dict[str, int] = attr.ib(factory=dict)
+    work: typing.List[int] = attr.ib(factory=list)
+    queued: typing.Set[int] = attr.ib(factory=set)
+
+    def value(self, v: Q.Val) -> typing.Optional[Value]:
+        if isinstance(v, (Q.Constant, Q.SConstant)):
+            return v
+        if isinstance(v, Q.Var):
+            return self.values.get(v.name)
+        return varying
+
+    def queue(self, block: str) -> None:
+        no = self.order[block]
+        if no not in self.queued:
+            self.queued.add(no)
+            heapq.heappush(self.work, no)
+
+    def define(self, v: Q.Var, val: typing.Optional[Value]) -> None:
+        old = self.values.get(v.name)
+        new = meet(old, val)
+        if new is not None and new != old:
+            self.values[v.name] = new
+            for b in self.users.get(v.name, ()):
+                if b in self.memory:
+                    self.queue(b)
+
+    def flow(self, target: Q.Label, mem: Memory) -> None:
+        old = self.memory.get(target.name)
+        if old is None:
+            self.memory[target.name] = dict(mem)
+            self.queue(target.name)
+            return
+        new = {p: meet(old.get(p), mem.get(p)) for p in old.keys() | mem.keys()}
+        if new != old:
+            self.memory[target.name] = new
+            self.queue(target.name)
+
+    def call(self, q: Q.Call) -> typing.Optional[Value]:
+        f = q.function
+        assert q.target is not None
+        if not isinstance(f, Q.GlobalVar) or isinstance(q.target.type, Q.Void):
+            return varying
+        builtin = f.name in prelude.const_fn_impls
+        if builtin and isinstance(q.target.type, Q.String):
+            # every string in between would be kept in values, and each one left would become a
+            # global of its own: a long sum of constants takes memory quadratic in its length
+            return varying
+        if not builtin and (self.evaluator is None or not self.evaluator.pure(f.name)):
+            return varying
+        args = [self.value(p) for p in q.params]
+        if any(a is varying for a in args):
+            return varying
+        if any(a is None for a in args):
+            return None
+        if builtin:
+            consts = [a.value for a in args]  # type: ignore
+            ret = evaluation.evaluated(f.name, consts, q.target.type)
+        else:
+            ret = self.evaluator.call(f.name, args)  # type: ignore
+        return varying if ret is evaluation.unknown else ret
+
+    def visit(self, name: str) -> None:
+        mem = dict(self.memory[name])
+        for q in self.graph.blocks[name].quads:
+            if isinstance(q, Q.Store):
+                mem[q.target.name] = self.value(q.source)
+            elif isinstance(q, Q.Load):
+                self.define(q.target, mem.get(q.source.name))  # type: ignore
+            elif isinstance(q, Q.Call) and q.target is not None:
+                self.define(q.target, self.call(q))
+            elif isinstance(q, Q.Branch):
+                self.flow(q.target, mem)
+            elif isinstance(q, Q.CondBranch):
+                cond = self.value(q.cond)
+                if cond is varying:
+                    self.flow(q.target_true, mem)
+                    self.flow(q.target_false, mem)
+                elif cond is not None:
+                    self.flow(q.target_true if cond.value else q.target_false, mem)  # type: ignore
+
+    def run(self, params: typing.List[Q.Var]) -> None:
+        for p in params:
+            self.values[p.name] = varying
+        names = self.graph.order()
+        self.order = self.graph.number()
+        for name in names:
+            for q in self.graph.blocks[name].quads:
+                for v in _used(q):
+                    if isinstance(v, Q.Var):
+                        self.users.setdefault(v.name, set()).add(name)
+                if isinstance(q, (Q.Call, Q.Load)) and q.target is not None:
+                    self.defined[q.target.name] = name
+        self.flow(Q.Label("entry"), {})
+        while self.work:
+            while self.work:
+                no = heapq.heappop(self.work)
+                self.queued.remove(no)
+                self.visit(names[no])
+            # a condition still without a value is undefined on every path run: if the quad
+            # defining it never runs, no path at all gives it one, so either branch is right and
+            # the true one is taken; otherwise (an uninitialized load, say) both are
+            for name in list(self.memory):
+                end = self.graph.blocks[name].quads[-1]
+                if isinstance(end, Q.CondBranch) and self.value(end.cond) is None:
+                    cond: Q.Var = end.cond  # type: ignore
+                    if self.defined.get(cond.name) in self.memory:
+                        self.define(cond, varying)
+                    else:
+                        self.define(cond, Q.Constant(Q.I1(), True))
+                    self.queue(name)
+
+
+def _folded(q: Q.Quad, sub: typing.Callable[[Q.Val], Q.Val]) -> typing.Optional[Q.Quad]:
+    # the quad with the known constants put in, None if it only computed one of them
+    if isinstance(q, Q.Call):
+        if q.target is not None and sub(q.target) is not q.target:
+            return None
+        return Q.Call(q.target, q.function, [sub(p) for p in q.params])
+    if isinstance(q, Q.Load):
+        return None if sub(q.target) is not q.target else q
+    if isinstance(q, Q.Store):
+        return Q.Store(sub(q.source), q.target)
+    if isinstance(q, Q.Return):
+        return Q.Return(sub(q.val) if q.val is not None else None)
+    if isinstance(q, Q.CondBranch):
+        cond = sub(q.cond)
+        if isinstance(cond, Q.Constant):
+            return Q.Branch(q.target_true if cond.value else q.target_false)
+        return Q.CondBranch(cond, q.target_true, q.target_false)
+    return q
+
+
+def propagate(
+    f: Q.Function,
+    evaluator: typing.Optional[evaluation.Evaluator] = None,
+) -> Q.Function:
+    graph = cfg.of(f.body)
+    if "entry" not in graph.blocks:
+        return f
+    prop = Propagation(graph=graph, evaluator=evaluator)
+    prop.run(f.params)
+    stats = context.current().telemetry
+
+    def sub(v: Q.Val) -> Q.Val:
+        val = prop.values.get(v.name) if isinstance(v, Q.Var) else None
+        return v if val is None or val is varying else val  # type: ignore
+
+    for name in list(graph.blocks):
+        if name not in prop.memory:
+            stats.count("blocks removed")
+            graph.remove(name)
+    for name, block in graph.blocks.items():
+        quads: typing.List[Q.Quad] = []
+        for q in block.quads:
+            folded = _folded(q, sub)
+            if folded is None:
+                stats.count("quads folded")
+            else:
+                quads.append(folded)
+        end = block.quads[-1]
+        block.quads = quads
+        if isinstance(end, Q.CondBranch) and isinstance(quads[-1], Q.Branch):
+            # a branch on a constant, the edge not taken goes
+            graph.set_end(name, quads[-1])
+    return attr.evolve(f, body=graph.body())
+
+
+def propagation(p: Q.Program) -> Q.Program:
+    steps = context.current().cfg["eval_steps"]
+    evaluator = None
+    if steps > 0:
+        evaluator = evaluation.Evaluator(functions=evaluation.pure_functions(p), steps=steps)
+    return [propagate(f, evaluator) for f in p]
@@ -0,0 +1,170 @@
+import typing
+import attr
+from .. import context
+from .. import quads as Q
+from . import cfg
+
+# construction of SSA form (Cytron et al.) over functions after pruning, promoting the allocas of
+# memassignment to registers. A phi is placed for a variable on the iterated dominance frontier of
+# the blocks storing it; a load takes the value of the last store or phi before it in its block,
+# or else the value at the end of its immediate dominator, the blocks being visited in reverse
+# postorder. Phis choosing between one value and themselves are replaced by that value, the ones
+# no quad reads are dropped, as are the blocks never reached from the entry.
+
+
+def _operands(q: Q.Quad) -> typing.List[Q.Val]:
+    if isinstance(q, Q.Call):
+        return [q.function, *q.params]
+    if isinstance(q, Q.CondBranch):
+        return [q.cond]
+    if isinstance(q, Q.Return):
+        return [] if q.val is None else [q.val]
+    if isinstance(q, Q.Store):
+        return [q.source, q.target]
+    if isinstance(q, Q.Load):
+        return [q.source]
+    if isinstance(q, Q.Phi):
+        return [v for v, _ in q.incoming]
+    return []
+
+
+def _substituted(q: Q.Quad, sub: typing.Callable[[Q.Val], Q.Val]) -> Q.Quad:
+    if isinstance(q, Q.Call):
+        return Q.Call(q.target, sub(q.function), [sub(p) for p in q.params])
+    if isinstance(q, Q.CondBranch):
+        return Q.CondBranch(sub(q.cond), q.target_true, q.target_false)
+    if isinstance(q, Q.Return):
+        return Q.Return(None if q.val is None else sub(q.val))
+    if isinstance(q, Q.Store):
+        return Q.Store(sub(q.source), q.target)
+    if isinstance(q, Q.Phi):
+        return Q.Phi(q.target, [(sub(v), l) for v, l in q.incoming])
+    return q
+
+
+def promotable(body: typing.List[Q.Quad]) -> typing.Dict[str, Q.Var]:
+    # the allocas only ever loaded from and stored to, by the names of their pointers
+    allocas = {q.target.name: q.target for q in body if isinstance(q, Q.Alloc)}
+    for q in body:
+        for v in _operands(q):
+            if isinstance(v, Q.Var) and v.name in allocas:
+                if isinstance(q, Q.Load) or isinstance(q, Q.Store) and v is q.target:
+                    continue
+                del allocas[v.name]
+    return allocas
+
+
+def promote(f: Q.Function) -> Q.Function:
+    allocas = promotable(f.body)
+    if not allocas:
+        return f
+    stats = context.current().telemetry
+    stats.count("allocas promoted", len(allocas))
+    graph = cfg.of(f.body)
+    removed = graph.remove_unreachable()
+    if removed:
+        stats.count("blocks removed", removed)
+    order, number = graph.order(), graph.number()
+    idom, df = graph.idom(), graph.frontiers()
+
+    # the phis of every block, by the names of the allocas
+    phis: typing.Dict[str, typing.Dict[str, Q.Var]] = {name: {} for name in order}
+    stored: typing.Dict[str, typing.Set[str]] = {}
+    for name in order:
+        for q in graph.blocks[name].quads:
+            if isinstance(q, Q.Store) and q.target.name in allocas:
+                stored.setdefault(q.target.name, set()).add(name)
+    for v, defs in stored.items():
+        work = sorted(defs, key=number.__getitem__)
+        while work:
+            for d in sorted(df[work.pop()], key=number.__getitem__):
+                if v not in phis[d]:
+                    phis[d][v] = Q.new_var(allocas[v].type.type)  # type: ignore
+                    if d not in defs:
+                        work.append(d)
+
+    # the values of the allocas at the end of the blocks, and what the loads and the trivial phis
+    # are replaced with
+    ends: typing.Dict[str, typing.Dict[str, Q.Val]] = {name: {} for name in order}
+    replaced: typing.Dict[str, Q.Val] = {}
+
+    def reaching(v: str, name: str) -> Q.Val:
+        # the value at the end of the block, remembered on the way up the dominator tree
+        path = []
+        while v not in ends[name] and name != "entry":
+            path.append(name)
+            name = idom[name]
+        ret = ends[name].get(v)
+        if ret is None:
+            ret = Q.Undef(allocas[v].type.type)  # type: ignore
+        for p in path:
+            ends[p][v] = ret
+        return ret
+
+    bodies: typing.Dict[str, typing.List[Q.Quad]] = {}
+    for name in order:
+        cur = ends[name]
+        cur.update(phis[name])
+        body: typing.List[Q.Quad] = []
+        for q in graph.blocks[name].quads[1:]:
+            if isinstance(q, Q.Alloc) and q.target.name in allocas:
+                continue
+            if isinstance(q, Q.Store) and q.target.name in allocas:
+                cur[q.target.name] = q.source
+            elif isinstance(q, Q.Load) and q.source.name in allocas:  # type: ignore
+                v = q.source.name  # type: ignore
+                replaced[q.target.name] = cur[v] if v in cur else reaching(v, idom[name])
+            else:
+                body.append(q)
+        bodies[name] = body
+
+    incoming: typing.Dict[str, typing.List[typing.Tuple[Q.Val, Q.Label]]] = {}
+    for name, ps in phis.items():
+        for v, t in ps.items():
+            incoming[t.name] = [(reaching(v, p), Q.Label(p)) for p in graph.blocks[name].preds]
+
+    def resolve(v: Q.Val) -> Q.Val:
+        while isinstance(v, Q.Var) and v.name in replaced:
+            v = replaced[v.name]
+        return v
+
+    changed = True
+    while changed:
+        changed = False
+        for ps in phis.values():
+            for t in ps.values():
+                if t.name in replaced:
+                    continue
+                values = {resolve(v) for v, _ in incoming[t.name]} - {t}
+                if len(values) <= 1:
+                    replaced[t.name] = values.pop() if values else Q.Undef(t.type)
+                    changed = True
+
+    # the phis read by the other quads, and by the phis read
+    for name, body in bodies.items():
+        bodies[name] = [_substituted(q, resolve) for q in body]
+    live: typing.Set[str] = set()
+    reads = [
+        v.name for body in bodies.values() for q in body for v in _operands(q)
+        if isinstance(v, Q.Var)
+    ]
+    while reads:
+        name = reads.pop()
+        if name in incoming and name not in live:
+            live.add(name)
+            sources = (resolve(v) for v, _ in incoming[name])
+            reads.extend(v.name for v in sources if isinstance(v, Q.Var))
+
+    ret: typing.List[Q.Quad] = []
+    for name, b in graph.blocks.items():
+        ret.append(b.quads[0])
+        for t in phis[name].values():
+            if t.name in live and t.name not in replaced:
+                stats.count("phis")
+                ret.append(Q.Phi(t, [(resolve(v), l) for v, l in incoming[t.name]]))
+        ret.extend(bodies[name])
+    return attr.evolve(f, body=ret)
+
+
+def promotion(p: Q.Program) -> Q.Program:
+    return list(map(promote, p))
@@ -1,6 +1,6 @@
 import typing
 import attr
-from . import ast
+from . import ast, context
 
 
 # TYPES
@@ -108,6 +108,12 @@ class Constant(Val):
         return f"{int(self.value)}"
 
 
+@attr.s(frozen=True, auto_attribs=True, repr=False)
+class Undef(Val):
+    def __repr__(self):
+        return "undef"
+
+
 # QUADS
 
 
@@ -171,6 +177,13 @@ class Store(Quad):
     target: Var
 
 
+@attr.s(frozen=True, auto_attribs=True)
+class Phi(Quad):
+    target: Var
+    # the value coming from each predecessor
+    incoming: typing.List[typing.Tuple[Val, Label]]
+
+
 # TOPLEVEL
 
 
@@ -188,7 +201,20 @@ Program = typing.List[Function]
 # UTILITY
 
 
+# lowered types, keyed by the identity of the canonical ast type
+_lowered_types: typing.Dict[int, RegType] = {}
+
+
 def from_ast_type(t: ast.Type) -> RegType:
+    t = ast.canonical(t)
+    ret = _lowered_types.get(id(t))
+    if ret is None:
+        ret = _lower_type(t)
+        _lowered_types[id(t)] = ret
+    return ret
+
+
+def _lower_type(t: ast.Type) -> RegType:
     if isinstance(t, ast.Int):
         return I32()
     elif isinstance(t, ast.Bool):
@@ -211,37 +237,30 @@ def identity(t: RegType) -> GlobalVar:
     return GlobalVar(FunctionPtr(t, [t]), name="__builtin__id")
 
 
-var_cnt: int = 0
-label_cnt: int = 0
-string_cnt: int = 0
-is_returned: bool = False
-
-
-quad_list: typing.List[Quad] = []
-defer_stack: typing.List[typing.List[Quad]] = []
-string_const_list: typing.List[str] = []
+# the counters and quad buffers below live in the compilation context
 
 
 def gather() -> typing.List[Quad]:
-    ret = quad_list[:]
-    quad_list.clear()
+    ctx = context.current()
+    ret = ctx.quad_list[:]
+    ctx.quad_list.clear()
     return ret
 
 
 def new_var(t: RegType) -> Var:
-    global var_cnt
-    name = f"v{var_cnt}"
-    var_cnt += 1
+    ctx = context.current()
+    name = f"v{ctx.var_cnt}"
+    ctx.var_cnt += 1
     return Var(t, name)
 
 
 def new_str_const(value: str) -> GlobalVar:
-    global string_cnt
-    name = f"s{string_cnt}"
-    string_cnt += 1
+    ctx = context.current()
+    name = f"s{ctx.string_cnt}"
+    ctx.string_cnt += 1
 
     vl = len(value)+1
-    string_const_list.append(
+    ctx.string_const_list.append(
         f"@_{name} = internal constant [{vl} x i8] c\"{value}\\00\"\n"
         f"@{name} = global %struct.S {'{'} i8* getelementptr inbounds ([{vl} x i8], [{vl} x i8]* @_{name}, i32 0, i32 0), i32 1000000000 {'}'}\n"  # noqa
     )
@@ -249,29 +268,35 @@ def new_str_const(value: str) -> GlobalVar:
 
 
 def get_string_consts() -> typing.List[str]:
-    ret = string_const_list[:]
-    string_const_list.clear()
+    ctx = context.current()
+    ret = ctx.string_const_list[:]
+    ctx.string_const_list.clear()
     return ret
 
 
 def new_label() -> Label:
-    global label_cnt
-    name = f"L{label_cnt}"
-    label_cnt += 1
+    ctx = context.current()
+    name = f"L{ctx.label_cnt}"
+    ctx.label_cnt += 1
     return Label(name)
 
 
 def add_quad(q: Quad) -> None:
-    quad_list.append(q)
+    context.current().quad_list.append(q)
 
 
 def add_defer(q: Quad) -> None:
-    defer_stack[-1].append(q)
+    context.current().defer_stack[-1].append(q)
 
 
 def open_defer_scope() -> None:
-    defer_stack.append([])
+    context.current().defer_stack.append([])
 
 
 def close_defer_scope() -> typing.List[Quad]:
-    return defer_stack.pop()
+    return context.current().defer_stack.pop()
+
+
+def all_defers() -> typing.List[Quad]:
+    # of every open scope, the outermost first
+    return sum(context.current().defer_stack, [])
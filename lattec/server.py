@@ -0,0 +1,105 @@
+import json
+import os
+import queue
+import signal
+import socket
+import stat
+import threading
+import traceback
+import typing
+from . import cache, compiler, parallel, telemetry
+
+# requests carry one JSON object per line: {"code": source, "options": {...}}, answered with
+# {"exit": exit code, "report": what the command line prints, "llvm": module or null, "trace":
+# Chrome trace of the stages or null, "cache": {"dir", "size", "key"} of the result in the cache,
+# where the bitcode goes along with it, or null}, or with {"error": traceback} when the request
+# could not be handled. Directories in the options are absolute, the server running elsewhere
+
+
+# options a request may set, the rest stay as the server was started with
+request_options = [
+    "silent", "wshadow", "packrat", "stream", "flat", "report_walks", "stats", "eval_steps",
+    "jobs", "cache", "cache_size", "profile", "profile_mode", "profile_interval",
+]
+
+
+def handle(request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    code = request["code"]
+    options = {k: v for k, v in request.get("options", {}).items() if k in request_options}
+    if options.get("cache") is None:
+        # a request without a cache uses the one the server was started with, if any
+        options.pop("cache", None)
+    result = compiler.compile(code, options)
+    trace = options.get("stats") == "json"
+    store = cache.of(result.context.cfg)
+    return {
+        "exit": 0 if result.ok else -1-result.stage,  # type: ignore
+        "report": compiler.report(code, result),
+        "llvm": result.llvm,
+        "trace": telemetry.trace(result.context.telemetry) if trace else None,
+        "cache": None if store is None else {
+            "dir": store.root, "size": store.max_size, "key": store.key(code, result.context.cfg),
+        },
+    }
+
+
+def serve_connection(conn: socket.socket) -> None:
+    with conn, conn.makefile("rwb") as f:
+        for line in f:
+            try:
+                response = handle(json.loads(line))
+            except Exception:
+                response = {"error": traceback.format_exc()}
+            f.write(json.dumps(response).encode() + b"\n")
+            f.flush()
+
+
+def serve(path: str, workers: int = 4, backlog: int = 16) -> None:
+    """Compiles the requests coming to a unix socket until interrupted. Accepted connections wait
+    in a queue of backlog entries for a free worker; while it is full, no more connections are
+    accepted and clients wait in the listen backlog of the socket."""
+    try:
+        mode: typing.Optional[int] = os.lstat(path).st_mode
+    except FileNotFoundError:
+        mode = None
+    if mode is not None:
+        # only the socket left by a server gone is replaced, never a file someone put there
+        if not stat.S_ISSOCK(mode):
+            raise SystemExit(f"{path} exists and is not a socket")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            sock.close()
+            raise SystemExit(f"a compile server is already running at {path}")
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+        os.remove(path)
+
+    parallel.start_from_forkserver()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(backlog)
+    pending: "queue.Queue[socket.socket]" = queue.Queue(maxsize=backlog)
+
+    def worker() -> None:
+        while True:
+            conn = pending.get()
+            try:
+                serve_connection(conn)
+            except OSError:
+                pass  # the client went away
+
+    for _ in range(workers):
+        threading.Thread(target=worker, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"serving on {path} with {workers} workers")
+    try:
+        while True:
+            conn, _ = sock.accept()
+            pending.put(conn)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        os.remove(path)
@@ -0,0 +1,193 @@
+import contextlib
+import os
+import threading
+import time
+import typing
+import attr
+
+if typing.TYPE_CHECKING:
+    from . import profiling
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Span:
+    name: str
+    # time.perf_counter() at the start, comparable between the processes of a compilation
+    start: float
+    wall: float = 0.0
+    cpu: float = 0.0
+    # the most memory allocated at once during the span, in bytes, when memory is traced
+    peak_memory: typing.Optional[int] = None
+    counters: typing.Dict[str, int] = attr.ib(factory=dict)
+    process: int = attr.ib(factory=os.getpid)
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class Telemetry:
+    """Time, memory and counters of the stages of a compilation, recorded when enabled. A stage
+    run once for every function makes a span for each of them; spans do not nest."""
+    enabled: bool = False
+    origin: float = attr.ib(factory=time.perf_counter)
+    spans: typing.List[Span] = attr.ib(factory=list)
+    current: typing.Optional[Span] = None
+    # profiles the stages, whether they are measured or not
+    profiler: typing.Optional["profiling.Profiler"] = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> typing.Iterator[None]:
+        if self.profiler is not None:
+            self.profiler.enter(name)
+        try:
+            with self.measured(name):
+                yield
+        finally:
+            if self.profiler is not None:
+                self.profiler.leave()
+
+    @contextlib.contextmanager
+    def measured(self, name: str) -> typing.Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        import tracemalloc
+        span = Span(name=name, start=time.perf_counter())
+        # the time of the thread, not of the process, which may be running other compilations
+        cpu = time.thread_time()
+        alone = _alone()
+        if alone is not None and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self.current = span
+        try:
+            yield
+        finally:
+            self.current = None
+            span.wall = time.perf_counter() - span.start
+            span.cpu += time.thread_time() - cpu
+            if alone is not None and _alone() == alone and tracemalloc.is_tracing():
+                span.peak_memory = tracemalloc.get_traced_memory()[1]
+            self.spans.append(span)
+
+    def run_here(self, f: typing.Callable, *args: typing.Any) -> typing.Any:
+        """Runs f in the current thread as part of the stage, the thread which was running it
+        waiting meanwhile, and counts the time the thread takes in the stage."""
+        cpu = time.thread_time()
+        try:
+            return f(*args)
+        finally:
+            span = self.current
+            if span is not None:
+                span.cpu += time.thread_time() - cpu
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.current is not None:
+            self.current.counters[name] = self.current.counters.get(name, 0) + n
+
+
+# tracemalloc and its peak are shared by the whole process, as by the concurrent requests of the
+# compile server. The memory of a span is only reported when no other compilation ran in the
+# process meanwhile; the tracing is started by the first compilation measured and stopped with the
+# last one, unless someone else started it. Importing it takes longer than a small compilation, it
+# is only imported when measuring
+_lock = threading.Lock()
+_running = 0
+# compilations started so far, telling whether another one started during a span
+_started = 0
+_measured = 0
+_stop_tracing = False
+
+
+def _alone() -> typing.Optional[int]:
+    with _lock:
+        return _started if _running == 1 else None
+
+
+def start_compilation(measured: bool) -> None:
+    global _running, _started, _measured, _stop_tracing
+    with _lock:
+        _running += 1
+        _started += 1
+        if measured:
+            import tracemalloc
+            if _measured == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _stop_tracing = True
+            _measured += 1
+
+
+def end_compilation(measured: bool) -> None:
+    global _running, _measured, _stop_tracing
+    with _lock:
+        _running -= 1
+        if measured:
+            _measured -= 1
+            if _measured == 0 and _stop_tracing:
+                import tracemalloc
+                tracemalloc.stop()
+                _stop_tracing = False
+
+
+@contextlib.contextmanager
+def running(measured: bool) -> typing.Iterator[None]:
+    start_compilation(measured)
+    try:
+        yield
+    finally:
+        end_compilation(measured)
+
+
+def _forked() -> None:
+    # the compilations of the parent do not run in a forked process
+    global _lock, _running, _measured, _stop_tracing
+    _lock = threading.Lock()
+    _running = 0
+    _measured = 0
+    _stop_tracing = False
+
+
+os.register_at_fork(after_in_child=_forked)
+
+
+def table(spans: typing.List[Span]) -> typing.List[str]:
+    """The spans summed up by stage, in the order the stages first ran."""
+    stages: typing.Dict[str, typing.List[Span]] = {}
+    for s in spans:
+        stages.setdefault(s.name, []).append(s)
+    wall = sum(s.wall for s in spans)
+
+    ret = [
+        f"{'stage':<24}{'runs':>6}{'wall ms':>10}{'%':>7}{'cpu ms':>10}{'peak KiB':>10}  counters"
+    ]
+    for name, ss in stages.items():
+        peaks = [s.peak_memory for s in ss if s.peak_memory is not None]
+        counters: typing.Dict[str, int] = {}
+        for s in ss:
+            for k, v in s.counters.items():
+                counters[k] = counters.get(k, 0) + v
+        stage_wall = sum(s.wall for s in ss)
+        ret.append(
+            f"{name:<24}{len(ss):>6}{stage_wall * 1000:>10.1f}{stage_wall / (wall or 1.0):>7.1%}"
+            f"{sum(s.cpu for s in ss) * 1000:>10.1f}"
+            f"{max(peaks) / 1024 if peaks else float('nan'):>10.0f}  "
+            + ", ".join(f"{k}: {v}" for k, v in counters.items())
+        )
+    ret.append(f"{'total':<24}{len(spans):>6}{wall * 1000:>10.1f}")
+    return ret
+
+
+def trace(telemetry: Telemetry) -> typing.Dict[str, typing.Any]:
+    """The spans as Chrome trace events, for chrome://tracing or Perfetto."""
+    return {
+        "traceEvents": [
+            {
+                "name": s.name,
+                "ph": "X",
+                "ts": (s.start - telemetry.origin) * 1e6,
+                "dur": s.wall * 1e6,
+                "pid": s.process,
+                "tid": s.process,
+                "args": {"cpu_ms": s.cpu * 1000, "peak_memory": s.peak_memory, **s.counters},
+            }
+            for s in telemetry.spans
+        ],
+        "displayTimeUnit": "ms",
+    }
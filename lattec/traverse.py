@@ -1,34 +1,85 @@
+import types
 import typing
 import attr
 from . import ast
 
 
+def _holds_nodes(t: typing.Any) -> bool:
+    if isinstance(t, type):
+        return issubclass(t, ast.Node)
+    return any(_holds_nodes(a) for a in getattr(t, "__args__", ()))
+
+
+_child_fields: typing.Dict[type, typing.Tuple[str, ...]] = {}
+
+
+def child_fields(cls: type) -> typing.Tuple[str, ...]:
+    """Names of the fields of a node class that may hold subtrees, computed once per class."""
+    ret = _child_fields.get(cls)
+    if ret is None:
+        ret = tuple(f.name for f in attr.fields(cls) if _holds_nodes(f.type))
+        _child_fields[cls] = ret
+    return ret
+
+
+def trampoline(step: typing.Any) -> typing.Any:
+    """Runs nested generators on an explicit stack instead of nesting Python calls. A generator
+    yields either a sub-generator, and gets resumed with its return value, or a ready value."""
+    if not isinstance(step, types.GeneratorType):
+        return step
+    stack = [step]
+    value = None
+    while True:
+        try:
+            sub = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            if not stack:
+                return e.value
+            value = e.value
+            continue
+        if isinstance(sub, types.GeneratorType):
+            stack.append(sub)
+            value = None
+        else:
+            value = sub
+
+
 def traverse(
     root: ast.Node,
-    pre_order: typing.List[typing.Callable[[ast.Node], None]] = [],
+    pre_order: typing.List[typing.Callable[[ast.Node], typing.Optional[ast.Node]]] = [],
     post_order: typing.List[typing.Callable[[ast.Node], typing.Optional[ast.Node]]] = [],
 ) -> ast.Node:
-    def traverse_impl(tree: ast.Node) -> ast.Node:
+    # visits are generators driven by trampoline, so deep trees do not hit the recursion limit
+    def traverse_impl(tree: ast.Node) -> typing.Generator[typing.Any, ast.Node, ast.Node]:
         ret: typing.Optional[ast.Node] = None  # for the typecheck
         for pre_f in pre_order:
             ret = pre_f(tree)
             if ret is not None:
                 tree = ret
 
-        d = attr.asdict(tree, recurse=False)
-        for k, v in d.items():
+        # a node is only rebuilt when some of its children got replaced
+        changed: typing.Dict[str, typing.Any] = {}
+        for k in child_fields(type(tree)):
+            v = getattr(tree, k)
             if isinstance(v, list):
+                new_v = None
                 for i, e in enumerate(v):
                     if isinstance(e, ast.Node):
-                        ret = traverse_impl(e)
-                        if ret is not None:
-                            v[i] = ret
+                        ret = yield traverse_impl(e)
+                        if ret is not e:
+                            if new_v is None:
+                                new_v = v[:]
+                            new_v[i] = ret
+                if new_v is not None:
+                    changed[k] = new_v
             elif isinstance(v, ast.Node):
-                ret = traverse_impl(v)
-                if ret is not None:
-                    d[k] = ret
+                ret = yield traverse_impl(v)
+                if ret is not v:
+                    changed[k] = ret
 
-        tree = attr.evolve(tree, **d)
+        if changed:
+            tree = attr.evolve(tree, **changed)
 
         for post_f in post_order:
             ret = post_f(tree)
@@ -36,4 +87,4 @@ def traverse(
                 tree = ret
         return tree
 
-    return traverse_impl(root)
+    return trampoline(traverse_impl(root))
@@ -1,23 +1,65 @@
 #!/usr/bin/bash
 
+# one warm compile server for all the tests instead of an interpreter per file
+socket=$(mktemp -u)
+./latc_llvm --serve --socket $socket > /dev/null &
+server=$!
+trap "kill $server" EXIT
+while [ ! -S $socket ]; do sleep 0.1; done
+latc="./latc_client --socket $socket"
+
+echo "SHOULD START QUICKLY:"
+
+./check_startup
+
 echo "SHOULD FAIL:"
 
-for f in latte_tests/bad/*.lat; do echo $f && ./latc_llvm $f --silent; done
+for f in latte_tests/bad/*.lat; do echo $f && $latc $f --silent; done
 
 echo "SHOULD NOT FAIL:"
 
 for f in latte_tests/good/*.lat
 do
-    echo $f && ./latc_llvm $f --silent --mrjp
+    echo $f && $latc $f --silent --mrjp
+done
+
+echo "SHOULD NOT FAIL ON DEEP NESTING:"
+
+stress=$(mktemp -d)
+python3 -c 'print("int main() { string s = \"\"; s = s" + " + \"a\"" * 100000 + "; return 0; }")' \
+    > $stress/long_sum.lat
+python3 -c 'print("int main() { int x = " + "(" * 5000 + "1" + ")" * 5000 + "; return 0; }")' \
+    > $stress/parens.lat
+python3 -c 'print("int main() { int x = 0; " + "{" * 5000 + "x++;" + "}" * 5000 + " return 0; }")' \
+    > $stress/blocks.lat
+for f in $stress/*.lat; do echo $f && $latc $f --silent; done
+
+echo "SHOULD COMPILE LONG SUMS OF STRINGS IN BOUNDED MEMORY:"
+
+for mode in "" --stream; do
+    echo "$stress/long_sum.lat $mode" && (ulimit -v 3000000; ./latc_llvm $stress/long_sum.lat --silent $mode)
+done
+rm -r $stress
+
+echo "SHOULD GIVE THE SERIAL OUTPUT WITH -j:"
+
+jobs=$(mktemp -d)
+for f in latte_tests/good/*.lat
+do
+    cp $f $jobs/serial.lat && cp $f $jobs/parallel.lat
+    ./latc_llvm $jobs/serial.lat --silent --stream > /dev/null
+    ./latc_llvm $jobs/parallel.lat --silent -j 4 > /dev/null
+    echo $f && cmp $jobs/serial.ll $jobs/parallel.ll
 done
+rm -r $jobs
 
 # echo "PROBABLY SHOULD FAIL:"
 
-# for f in mrjp-tests/bad/**/*.lat; do echo $f && ./latc_llvm $f --silent; done
+# for f in mrjp-tests/bad/**/*.lat; do echo $f && $latc $f --silent; done
 
 # echo "PROBABLY SHOULD NOT FAIL:"
 
 # for f in mrjp-tests/good/basic/*.lat
 # do
-#     echo $f && ./latc_llvm $f --silent --mrjp
+#     echo $f && $latc $f --silent --mrjp
 # done